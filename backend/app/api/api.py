@@ -1765,7 +1765,6 @@ async def list_email_configs(user: Dict[str, Any] = Depends(_get_current_user)):
         cfgs = db_list_configs(include_password=False, owner_email=owner_email)
         
         # Obtener límites del plan para enviar al frontend
-        from app.modules.email_processor.config_store import count_configs_by_owner
         from app.repositories.subscription_repository import SubscriptionRepository
         
         current_count = len(cfgs)
@@ -1803,36 +1802,28 @@ async def create_email_config(config: MultiEmailConfig, user: Dict[str, Any] = D
         from app.modules.email_processor.config_store import count_configs_by_owner
         from app.repositories.subscription_repository import SubscriptionRepository
         
-        # Contar cuentas actuales del usuario
-        current_count = count_configs_by_owner(owner_email)
-        
         # Obtener límite del plan del usuario
         sub_repo = SubscriptionRepository()
         subscription = await sub_repo.get_user_active_subscription(owner_email)
         
+        # Usuario sin suscripción activa (trial o free): solo 1 cuenta. -1 significa ilimitado
+        max_accounts = 1
         if subscription:
             plan_features = subscription.get('plan_features', {})
             max_accounts = plan_features.get('max_email_accounts', 2)  # Default: 2 cuentas
-            
-            # -1 significa ilimitado
-            if max_accounts != -1 and current_count >= max_accounts:
-                raise HTTPException(
-                    status_code=403, 
-                    detail=f"Has alcanzado el límite de {max_accounts} cuentas de correo de tu plan. Actualiza tu suscripción para agregar más."
-                )
-        else:
-            # Usuario sin suscripción activa (trial o free)
-            max_accounts = 1  # Solo 1 cuenta para usuarios sin plan
-            if current_count >= max_accounts:
-                raise HTTPException(
-                    status_code=403,
-                    detail="Has alcanzado el límite de cuentas de correo. Suscríbete a un plan para agregar más cuentas."
-                )
+        
+        # Contar cuentas actuales del usuario (el conteo se corta al llegar al límite)
+        if max_accounts != -1 and count_configs_by_owner(owner_email, cap=max_accounts) >= max_accounts:
+            if subscription:
+                detail = f"Has alcanzado el límite de {max_accounts} cuentas de correo de tu plan. Actualiza tu suscripción para agregar más."
+            else:
+                detail = "Has alcanzado el límite de cuentas de correo. Suscríbete a un plan para agregar más cuentas."
+            raise HTTPException(status_code=403, detail=detail)
         
         cfg_dict = config.model_dump()
         cfg_id = db_create_config(cfg_dict, owner_email=owner_email)
         
-        logger.info(f"✅ Nueva cuenta de correo creada para {owner_email}: {current_count + 1}/{max_accounts}")
+        logger.info(f"✅ Nueva cuenta de correo creada para {owner_email} (límite del plan: {max_accounts})")
         
         return {"success": True, "id": cfg_id}
     except HTTPException:
@@ -2247,7 +2238,6 @@ async def save_oauth_email_config(
     owner_email = (user.get('email') or '').lower()
     
     # Validate subscription limits
-    current_count = count_configs_by_owner(owner_email)
     sub_repo = SubscriptionRepository()
     subscription = await sub_repo.get_user_active_subscription(owner_email)
     
@@ -2255,13 +2245,13 @@ async def save_oauth_email_config(
         plan_features = subscription.get('plan_features', {})
         max_accounts = plan_features.get('max_email_accounts', 2)
         
-        if max_accounts != -1 and current_count >= max_accounts:
+        if max_accounts != -1 and count_configs_by_owner(owner_email, cap=max_accounts) >= max_accounts:
             raise HTTPException(
                 status_code=403,
                 detail=f"Has alcanzado el límite de {max_accounts} cuentas de correo de tu plan."
             )
     else:
-        if current_count >= 1:
+        if count_configs_by_owner(owner_email, cap=1) >= 1:
             raise HTTPException(
                 status_code=403,
                 detail="Has alcanzado el límite de cuentas de correo. Suscríbete a un plan para agregar más."
@@ -4963,12 +4953,16 @@ async def get_recent_activity(
 def _mongo_doc_to_invoice_data(doc: Dict[str, Any]) -> InvoiceData:
     """
     Convierte documento MongoDB a InvoiceData para compatibilidad con exportadores existentes.
+
+    Camino de solo lectura (se llama por cada factura exportada): los documentos ya
+    fueron validados al persistirse, así que se arma con model_construct() sin revalidar.
     """
     try:
         # DEBUG: Log de la estructura del documento
-        logger.info(f"🔍 Estructura del documento MongoDB: {list(doc.keys())}")
-        if "factura" in doc:
-            logger.info(f"🔍 Keys en factura: {list(doc['factura'].keys())}")
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(f"🔍 Estructura del documento MongoDB: {list(doc.keys())}")
+            if "factura" in doc:
+                logger.debug(f"🔍 Keys en factura: {list(doc['factura'].keys())}")
         
         # Extraer datos principales - Los datos están directamente en el doc según los logs
         productos = doc.get("productos", [])
@@ -5000,7 +4994,7 @@ def _mongo_doc_to_invoice_data(doc: Dict[str, Any]) -> InvoiceData:
                 pass
         
         # Crear InvoiceData usando datos del modelo v2 correctamente mapeados
-        logger.info(f"🔍 Valores específicos: numero_factura='{doc.get('numero_factura')}', cdc='{doc.get('cdc')}'")
+        logger.debug("🔍 Valores específicos: numero_factura='%s', cdc='%s'", doc.get('numero_factura'), doc.get('cdc'))
         
         # Obtener totales desde el modelo v2 estructura
         totales_data = doc.get("totales", {})
@@ -5011,7 +5005,7 @@ def _mongo_doc_to_invoice_data(doc: Dict[str, Any]) -> InvoiceData:
         if total_iva_v2 is None:
             total_iva_v2 = (totales_data.get("iva_5", 0) or 0) + (totales_data.get("iva_10", 0) or 0)
         
-        invoice = InvoiceData(
+        invoice = InvoiceData.model_construct(
             numero_factura=doc.get("numero_factura", "") or doc.get("numero_documento", ""),
             fecha=fecha,
             ruc_emisor=doc.get("ruc_emisor", "") or emisor_data.get("ruc", ""),
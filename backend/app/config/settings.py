@@ -90,6 +90,11 @@ class Settings(BaseSettings):
     # Límite específico para sincronización histórica por rango (ALL + SINCE/BEFORE).
     # 0 por defecto para no truncar históricos largos (2017->hoy, etc).
     IMAP_SEARCH_MAX_CANDIDATES_RANGE: int = int(os.getenv("IMAP_SEARCH_MAX_CANDIDATES_RANGE", 0))
+    # Conexiones IMAP del pool
+    IMAP_TIMEOUT_SECONDS: float = float(os.getenv("IMAP_TIMEOUT_SECONDS", 30))
+    IMAP_NOOP_TIMEOUT_SECONDS: float = float(os.getenv("IMAP_NOOP_TIMEOUT_SECONDS", 5))
+    IMAP_MAX_RETRIES: int = int(os.getenv("IMAP_MAX_RETRIES", 3))
+    IMAP_BACKOFF_BASE_SECONDS: float = float(os.getenv("IMAP_BACKOFF_BASE_SECONDS", 1))
     
     # Job Processing Limits
     JOB_MAX_RUNTIME_HOURS: int = int(os.getenv("JOB_MAX_RUNTIME_HOURS", 24))  # Parar job después de 24 horas
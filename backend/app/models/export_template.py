@@ -1,6 +1,8 @@
 from datetime import datetime
 from enum import Enum
-from typing import Any, Callable, Dict, List, Optional, Set
+from functools import lru_cache
+from types import MappingProxyType
+from typing import Any, Callable, Dict, FrozenSet, List, Mapping, Optional, Tuple
 
 from pydantic import BaseModel, ConfigDict, Field
 import logging
@@ -261,12 +263,21 @@ AVAILABLE_FIELD_CATEGORIES: Dict[str, List[str]] = {
 }
 
 
-def get_available_field_keys() -> Set[str]:
-    return set(AVAILABLE_FIELDS.keys())
+@lru_cache(maxsize=1)
+def get_available_field_keys() -> FrozenSet[str]:
+    """Claves exportables. Se calcula una vez: AVAILABLE_FIELDS es constante."""
+    return frozenset(AVAILABLE_FIELDS)
 
 
-def get_available_field_categories() -> Dict[str, List[str]]:
-    return {category: list(keys) for category, keys in AVAILABLE_FIELD_CATEGORIES.items()}
+@lru_cache(maxsize=1)
+def get_available_field_categories() -> Mapping[str, Tuple[str, ...]]:
+    """
+    Agrupación de campos por categoría para la UI.
+    Snapshot inmutable memoizado: los callers no pueden alterar la caché compartida.
+    """
+    return MappingProxyType(
+        {category: tuple(keys) for category, keys in AVAILABLE_FIELD_CATEGORIES.items()}
+    )
 
 
 def get_invalid_template_field_keys(fields: List[ExportField]) -> List[str]:
@@ -1,21 +1,48 @@
 from __future__ import annotations
-from typing import Optional, List
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Iterator, Optional, List
 from datetime import datetime
-from pydantic import BaseModel, Field, ConfigDict
+from pydantic import BaseModel, Field, ConfigDict, model_validator
 
 
+# Timestamp compartido para importaciones en lote: dentro de batch_timestamp()
+# todas las cabeceras creadas reciben el mismo created_at/updated_at sin volver
+# a consultar el reloj. Fuera de un lote se usa datetime.utcnow() como siempre.
+_BATCH_NOW: ContextVar[Optional[datetime]] = ContextVar("invoice_batch_now", default=None)
+
+
+def _utcnow() -> datetime:
+    return _BATCH_NOW.get() or datetime.utcnow()
+
+
+@contextmanager
+def batch_timestamp(now: Optional[datetime] = None) -> Iterator[datetime]:
+    """Fija el timestamp de creación para todas las cabeceras construidas en el bloque."""
+    ts = now or datetime.utcnow()
+    token = _BATCH_NOW.set(ts)
+    try:
+        yield ts
+    finally:
+        _BATCH_NOW.reset(token)
+
+
+# Los campos de texto son `str` (no Optional): map_invoice normaliza None -> ""
+# antes de construir, así pydantic valida solo la rama str. Solo quedan Optional
+# los campos donde None tiene significado (fecha_emision, processing_error, partes).
 class Party(BaseModel):
-    model_config = ConfigDict(populate_by_name=True)
-    ruc: Optional[str] = ""
-    nombre: Optional[str] = ""
-    direccion: Optional[str] = ""
-    telefono: Optional[str] = ""
-    email: Optional[str] = ""
-    actividad_economica: Optional[str] = ""
+    # Value object: se construye una vez en map_invoice y nunca se muta.
+    model_config = ConfigDict(populate_by_name=True, frozen=True, extra="ignore")
+    ruc: str = ""
+    nombre: str = ""
+    direccion: str = ""
+    telefono: str = ""
+    email: str = ""
+    actividad_economica: str = ""
 
 
 class Totales(BaseModel):
-    model_config = ConfigDict(populate_by_name=True)
+    model_config = ConfigDict(populate_by_name=True, frozen=True, extra="ignore")
     exentas: float = 0.0
     gravado_5: float = 0.0
     iva_5: float = 0.0
@@ -39,24 +66,24 @@ class Totales(BaseModel):
 class InvoiceHeader(BaseModel):
     model_config = ConfigDict(populate_by_name=True)
     id: str
-    cdc: Optional[str] = ""
+    cdc: str = ""
 
     # Documento
-    tipo_documento: Optional[str] = "CO"  # CO/CR
-    establecimiento: Optional[str] = ""
-    punto: Optional[str] = ""
-    numero: Optional[str] = ""
-    numero_documento: Optional[str] = ""
-    message_id: Optional[str] = ""
+    tipo_documento: str = "CO"  # CO/CR
+    establecimiento: str = ""
+    punto: str = ""
+    numero: str = ""
+    numero_documento: str = ""
+    message_id: str = ""
     fecha_emision: Optional[datetime] = None
-    condicion_venta: Optional[str] = "CONTADO"
+    condicion_venta: str = "CONTADO"
 
     # Moneda
-    moneda: Optional[str] = "GS"
+    moneda: str = "GS"
     tipo_cambio: float = 0.0
 
     # Identificadores
-    timbrado: Optional[str] = ""
+    timbrado: str = ""
 
     # Partes
     emisor: Optional[Party] = None
@@ -67,46 +94,55 @@ class InvoiceHeader(BaseModel):
 
     # === Estado de procesamiento ===
     # PROCESSING → DONE | PENDING_AI | FAILED
-    status: Optional[str] = "DONE"
+    status: str = "DONE"
     processing_error: Optional[str] = None
 
     # === Campos nuevos XSD SIFEN v150 ===
     # Verificación SET (gCamFuFD)
-    qr_url: Optional[str] = ""
-    info_adicional: Optional[str] = ""
+    qr_url: str = ""
+    info_adicional: str = ""
 
     # Tipo de Documento Electrónico (gTimb)
-    tipo_documento_electronico: Optional[str] = ""   # ej: "Factura electrónica"
-    tipo_de_codigo: Optional[str] = ""               # 1=Factura, 4=Autofactura, 5=NC, 6=ND
+    tipo_documento_electronico: str = ""   # ej: "Factura electrónica"
+    tipo_de_codigo: str = ""               # 1=Factura, 4=Autofactura, 5=NC, 6=ND
 
     # Indicador de presencia (gCamFE)
-    ind_presencia: Optional[str] = ""                # ej: "Operación presencial"
-    ind_presencia_codigo: Optional[str] = ""
+    ind_presencia: str = ""                # ej: "Operación presencial"
+    ind_presencia_codigo: str = ""
 
     # Crédito (gCamCond.gPagCred)
-    cond_credito: Optional[str] = ""
-    cond_credito_codigo: Optional[str] = ""
-    plazo_credito_dias: Optional[int] = 0
+    cond_credito: str = ""
+    cond_credito_codigo: str = ""
+    plazo_credito_dias: int = 0
 
     # Ciclo de facturación — servicios (gCamEsp.gGrupAdi)
-    ciclo_facturacion: Optional[str] = ""
-    ciclo_fecha_inicio: Optional[str] = ""
-    ciclo_fecha_fin: Optional[str] = ""
+    ciclo_facturacion: str = ""
+    ciclo_fecha_inicio: str = ""
+    ciclo_fecha_fin: str = ""
 
     # Transporte (gTransp)
-    transporte_modalidad: Optional[str] = ""
-    transporte_modalidad_codigo: Optional[str] = ""
-    transporte_resp_flete_codigo: Optional[str] = ""
-    transporte_nro_despacho: Optional[str] = ""
+    transporte_modalidad: str = ""
+    transporte_modalidad_codigo: str = ""
+    transporte_resp_flete_codigo: str = ""
+    transporte_nro_despacho: str = ""
 
     # Metadata / Índices
-    email_origen: Optional[str] = ""
-    mes_proceso: Optional[str] = ""
-    fuente: Optional[str] = ""  # XML_NATIVO / OPENAI_VISION
-    minio_key: Optional[str] = ""
-    owner_email: Optional[str] = ""
-    created_at: datetime = Field(default_factory=datetime.utcnow)
-    updated_at: datetime = Field(default_factory=datetime.utcnow)
+    email_origen: str = ""
+    mes_proceso: str = ""
+    fuente: str = ""  # XML_NATIVO / OPENAI_VISION
+    minio_key: str = ""
+    owner_email: str = ""
+    created_at: datetime = Field(default_factory=_utcnow)
+    updated_at: datetime = Field(default_factory=_utcnow)
+
+    @model_validator(mode="before")
+    @classmethod
+    def _fill_timestamps(cls, data: Any) -> Any:
+        # Una sola lectura de reloj para ambos campos (y mismo valor en alta).
+        if isinstance(data, dict) and ("created_at" not in data or "updated_at" not in data):
+            now = _utcnow()
+            data = {"created_at": now, "updated_at": now, **data}
+        return data
 
 
 class InvoiceDetail(BaseModel):
@@ -115,11 +151,11 @@ class InvoiceDetail(BaseModel):
     linea: int
     descripcion: str
     cantidad: float
-    unidad: Optional[str] = ""
+    unidad: str = ""
     precio_unitario: float
     total: float
     iva: int = 0  # 0, 5, 10
-    owner_email: Optional[str] = ""
+    owner_email: str = ""
 
 
 class InvoiceDocument(BaseModel):
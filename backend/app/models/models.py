@@ -1,19 +1,31 @@
 # app/models/models.py
 
 from __future__ import annotations
-from typing import Optional, List, Dict
+from typing import Any, Literal, Optional, List, Dict
 from datetime import datetime
-from pydantic import BaseModel, Field, ConfigDict
+from pydantic import BaseModel, Field, ConfigDict, TypeAdapter
 
-from app.utils.date_utils import try_parse_date
+from app.utils.date_utils import coarse_now, try_parse_date
 
 # -----------------------
 # Utilidades
 # -----------------------
 def safe_float(value, default=0.0) -> float:
+    # Camino rápido: la mayoría de montos ya llegan como número o como
+    # string limpio ("1500", "1500.5"); solo los demás pasan por la normalización.
+    if value is None:
+        return default
+    tp = type(value)
+    if tp is float:
+        return value
+    if tp is int:
+        return float(value)
+    if tp is str:
+        try:
+            return float(value)
+        except ValueError:
+            pass
     try:
-        if value is None:
-            return default
         if isinstance(value, (int, float)):
             return float(value)
         if isinstance(value, list):
@@ -38,6 +50,19 @@ def safe_float(value, default=0.0) -> float:
     except Exception:
         return default
 
+_MONEDA_MAP = {
+    "GS": "GS", "PYG": "GS", "GUARANI": "GS", "GUARANÍES": "GS",
+    "USD": "USD", "DOLLAR": "USD", "DOLAR": "USD",
+}
+
+
+def _validated(model, values: Dict[str, Any]):
+    return model(**values)
+
+
+def _constructed(model, values: Dict[str, Any]):
+    return model.model_construct(**values)
+
 # -----------------------
 # Submodelos
 # -----------------------
@@ -49,8 +74,10 @@ class ProductoFactura(BaseModel):
     total: Optional[float] = 0.0
     iva: Optional[int] = 0
 
+# Submodelos que solo llegan en respuestas de OpenAI: defer_build posterga la
+# construcción de su validador hasta el primer uso (no en el arranque del worker).
 class EmpresaData(BaseModel):
-    model_config = ConfigDict(populate_by_name=True)
+    model_config = ConfigDict(populate_by_name=True, defer_build=True)
     nombre: Optional[str] = ""
     ruc: Optional[str] = ""
     direccion: Optional[str] = ""
@@ -58,235 +85,269 @@ class EmpresaData(BaseModel):
     actividad_economica: Optional[str] = ""
 
 class TimbradoData(BaseModel):
-    model_config = ConfigDict(populate_by_name=True)
+    model_config = ConfigDict(populate_by_name=True, defer_build=True)
     nro: Optional[str] = ""
     fecha_inicio_vigencia: Optional[str] = ""
     valido_hasta: Optional[str] = ""
 
 class FacturaData(BaseModel):
-    model_config = ConfigDict(populate_by_name=True)
+    model_config = ConfigDict(populate_by_name=True, defer_build=True)
     contado_nro: Optional[str] = ""
     fecha: Optional[str] = ""
     caja_nro: Optional[str] = ""
     cdc: Optional[str] = ""
     condicion_venta: Optional[str] = ""
 
+def _totales_alias(name: str) -> str:
+    # Las claves de IVA por tasa llegan como "iva_5%" en el JSON de OpenAI
+    return name + "%" if name.startswith("iva_") else name
+
+
 class TotalesData(BaseModel):
-    model_config = ConfigDict(populate_by_name=True)
+    model_config = ConfigDict(populate_by_name=True, defer_build=True, alias_generator=_totales_alias)
     cantidad_articulos: Optional[int] = 0
     subtotal: Optional[float] = 0.0
     total_a_pagar: Optional[float] = 0.0
-    iva_0: Optional[float] = Field(0.0, alias="iva_0%")
-    iva_5: Optional[float] = Field(0.0, alias="iva_5%")
-    iva_10: Optional[float] = Field(0.0, alias="iva_10%")
+    iva_0: Optional[float] = 0.0
+    iva_5: Optional[float] = 0.0
+    iva_10: Optional[float] = 0.0
     total_iva: Optional[float] = 0.0
 
 class ClienteData(BaseModel):
-    model_config = ConfigDict(populate_by_name=True)
+    model_config = ConfigDict(populate_by_name=True, defer_build=True)
     nombre: Optional[str] = ""
     ruc: Optional[str] = ""
     email: Optional[str] = ""
 
+# Validador de la lista completa: una sola llamada a pydantic-core por factura
+_PRODUCTOS_ADAPTER = TypeAdapter(List[ProductoFactura])
+
+
+def _build_productos(raw, build) -> List[ProductoFactura]:
+    """
+    Normaliza productos asegurando que 'nombre' exista (tomando 'descripcion'/'articulo'/'codigo').
+    Solo copia el dict cuando hay que completar 'nombre'; el parser XML ya lo trae.
+    """
+    payload = []
+    for p in raw or ():
+        if isinstance(p, dict):
+            if not p.get('nombre'):
+                p = {**p, 'nombre': p.get('descripcion') or p.get('articulo') or p.get('codigo') or ''}
+        else:
+            p = p.__dict__
+        payload.append(p)
+    if build is _validated:
+        return _PRODUCTOS_ADAPTER.validate_python(payload)
+    return [build(ProductoFactura, p) for p in payload]
+
 # -----------------------
 # Modelo principal de factura (mapeo directo del XML)
 # -----------------------
 class InvoiceData(BaseModel):
+    # Textos y montos sin Optional: from_dict normaliza None -> "" / 0.0 antes de construir.
+    # Solo quedan Optional los campos donde None significa "ausente" (fechas, submodelos, error).
     model_config = ConfigDict(populate_by_name=True)
 
     fecha: Optional[datetime] = None
-    tipo_documento: Optional[str] = "CO"  # CO contado, CR crédito
-    numero_documento: Optional[str] = ""
-    ruc_proveedor: Optional[str] = ""
-    razon_social_proveedor: Optional[str] = ""
-    condicion_compra: Optional[str] = "CONTADO"  # CONTADO | CREDITO
-
-    gravado_10: Optional[float] = 0.0
-    iva_10: Optional[float] = 0.0
-    gravado_5: Optional[float] = 0.0
-    iva_5: Optional[float] = 0.0
-    exento: Optional[float] = 0.0
-    total_factura: Optional[float] = 0.0
-
-    timbrado: Optional[str] = ""
-    cdc: Optional[str] = ""
-    moneda: Optional[str] = "GS"   # "GS" si es PYG, "USD" u otra tal cual en factura
-    tipo_cambio: Optional[float] = 0.0  # Por defecto 0, se actualiza si hay tipo de cambio específico
-    direccion_emisor: Optional[str] = ""
-    telefono_emisor: Optional[str] = ""
-    email_emisor: Optional[str] = ""
-
-    establecimiento: Optional[str] = ""
-    punto_expedicion: Optional[str] = ""
-    descripcion_factura: Optional[str] = ""
-    detalle_articulos: Optional[str] = ""
-    email_origen: Optional[str] = ""
-    message_id: Optional[str] = ""
-
-    procesado_en: Optional[datetime] = Field(default_factory=datetime.now)
-    mes_proceso: Optional[str] = ""
+    tipo_documento: Literal["CO", "CR"] = "CO"  # CO contado, CR crédito
+    numero_documento: str = ""
+    ruc_proveedor: str = ""
+    razon_social_proveedor: str = ""
+    condicion_compra: str = "CONTADO"  # CONTADO | CREDITO
+
+    gravado_10: float = 0.0
+    iva_10: float = 0.0
+    gravado_5: float = 0.0
+    iva_5: float = 0.0
+    exento: float = 0.0
+    total_factura: float = 0.0
+
+    timbrado: str = ""
+    cdc: str = ""
+    moneda: str = "GS"   # "GS" si es PYG, "USD" u otra tal cual en factura
+    tipo_cambio: float = 0.0  # Por defecto 0, se actualiza si hay tipo de cambio específico
+    direccion_emisor: str = ""
+    telefono_emisor: str = ""
+    email_emisor: str = ""
+
+    establecimiento: str = ""
+    punto_expedicion: str = ""
+    descripcion_factura: str = ""
+    detalle_articulos: str = ""
+    email_origen: str = ""
+    message_id: str = ""
+
+    procesado_en: Optional[datetime] = Field(default_factory=coarse_now)
+    mes_proceso: str = ""
 
     # campos "legacy" que siguen llegando desde el parser OpenAI
-    ruc_emisor: Optional[str] = ""
-    nombre_emisor: Optional[str] = ""
-    numero_factura: Optional[str] = ""
-    monto_total: Optional[float] = 0.0
-    iva: Optional[float] = 0.0
-    pdf_path: Optional[str] = ""
-    minio_key: Optional[str] = ""
-
-    ruc_cliente: Optional[str] = ""
-    nombre_cliente: Optional[str] = ""
-    email_cliente: Optional[str] = ""
-    direccion_cliente: Optional[str] = ""
-    telefono_cliente: Optional[str] = ""
-    condicion_venta: Optional[str] = ""  # CONTADO | CREDITO
-
-    subtotal_exentas: Optional[float] = 0.0
-    subtotal_5: Optional[float] = 0.0
-    subtotal_10: Optional[float] = 0.0
+    ruc_emisor: str = ""
+    nombre_emisor: str = ""
+    numero_factura: str = ""
+    monto_total: float = 0.0
+    iva: float = 0.0
+    pdf_path: str = ""
+    minio_key: str = ""
+
+    ruc_cliente: str = ""
+    nombre_cliente: str = ""
+    email_cliente: str = ""
+    direccion_cliente: str = ""
+    telefono_cliente: str = ""
+    condicion_venta: str = ""  # CONTADO | CREDITO
+
+    subtotal_exentas: float = 0.0
+    subtotal_5: float = 0.0
+    subtotal_10: float = 0.0
 
     # === CAMPOS CON NOMBRES EXACTOS DEL XML ===
-    base_gravada_5: Optional[float] = 0.0   # Nombre exacto del XML
-    base_gravada_10: Optional[float] = 0.0  # Nombre exacto del XML
-    monto_exento: Optional[float] = 0.0     # Nombre exacto del XML
-    exonerado: Optional[float] = 0.0        # dSubExo del XML
-    total_operacion: Optional[float] = 0.0  # dTotOpe del XML
-    total_descuento: Optional[float] = 0.0  # dTotDesc del XML 
-    total_iva: Optional[float] = 0.0        # dTotIVA del XML
-    total_base_gravada: Optional[float] = 0.0  # Total bases gravadas
-    anticipo: Optional[float] = 0.0         # dAnticipo del XML
+    base_gravada_5: float = 0.0   # Nombre exacto del XML
+    base_gravada_10: float = 0.0  # Nombre exacto del XML
+    monto_exento: float = 0.0     # Nombre exacto del XML
+    exonerado: float = 0.0        # dSubExo del XML
+    total_operacion: float = 0.0  # dTotOpe del XML
+    total_descuento: float = 0.0  # dTotDesc del XML 
+    total_iva: float = 0.0        # dTotIVA del XML
+    total_base_gravada: float = 0.0  # Total bases gravadas
+    anticipo: float = 0.0         # dAnticipo del XML
 
     # === CAMPOS NUEVOS XSD SIFEN v150 ===
     # Verificación documento (gCamFuFD)
-    qr_url: Optional[str] = ""              # dCarQR — URL para consultar en SET Paraguay
-    info_adicional: Optional[str] = ""      # dInfAdic — info adicional del emisor
+    qr_url: str = ""              # dCarQR — URL para consultar en SET Paraguay
+    info_adicional: str = ""      # dInfAdic — info adicional del emisor
 
     # Tipo de documento electrónico (gTimb)
-    tipo_documento_electronico: Optional[str] = ""   # dDesTiDE (ej: "Factura electrónica")
-    tipo_de_codigo: Optional[str] = ""               # iTiDE (1=Factura, 4=Autofactura, 5=NC, 6=ND)
+    tipo_documento_electronico: str = ""   # dDesTiDE (ej: "Factura electrónica")
+    tipo_de_codigo: str = ""               # iTiDE (1=Factura, 4=Autofactura, 5=NC, 6=ND)
 
     # Indicador de presencia (gCamFE)
-    ind_presencia: Optional[str] = ""       # dDesIndPres (ej: "Operación presencial")
-    ind_presencia_codigo: Optional[str] = ""# iIndPres
+    ind_presencia: str = ""       # dDesIndPres (ej: "Operación presencial")
+    ind_presencia_codigo: str = ""# iIndPres
 
     # Condición de crédito (gCamCond.gPagCred)
-    cond_credito: Optional[str] = ""        # dDCondCred (ej: "Plazo")
-    cond_credito_codigo: Optional[str] = "" # iCondCred
-    plazo_credito_dias: Optional[int] = 0   # dPlazoCre
+    cond_credito: str = ""        # dDCondCred (ej: "Plazo")
+    cond_credito_codigo: str = "" # iCondCred
+    plazo_credito_dias: int = 0   # dPlazoCre
 
     # Ciclo de facturación — servicios (gCamEsp.gGrupAdi)
-    ciclo_facturacion: Optional[str] = ""   # dCiclo (ej: "DICIEMBRE")
-    ciclo_fecha_inicio: Optional[str] = ""  # dFecIniC
-    ciclo_fecha_fin: Optional[str] = ""     # dFecFinC
+    ciclo_facturacion: str = ""   # dCiclo (ej: "DICIEMBRE")
+    ciclo_fecha_inicio: str = ""  # dFecIniC
+    ciclo_fecha_fin: str = ""     # dFecFinC
 
     # Transporte (gTransp)
-    transporte_modalidad: Optional[str] = ""          # dDesModTrans (ej: "Terrestre")
-    transporte_modalidad_codigo: Optional[str] = ""   # iModTrans
-    transporte_resp_flete_codigo: Optional[str] = ""  # iRespFlete
-    transporte_nro_despacho: Optional[str] = ""       # dNuDespImp
+    transporte_modalidad: str = ""          # dDesModTrans (ej: "Terrestre")
+    transporte_modalidad_codigo: str = ""   # iModTrans
+    transporte_resp_flete_codigo: str = ""  # iRespFlete
+    transporte_nro_despacho: str = ""       # dNuDespImp
 
     # ISC — Impuesto Selectivo al Consumo (gTotSub)
-    isc_total: Optional[float] = 0.0           # dLtotIsc
-    isc_base_imponible: Optional[float] = 0.0  # dBaseImpISC
-    isc_subtotal_gravado: Optional[float] = 0.0# dSubVISC
+    isc_total: float = 0.0           # dLtotIsc
+    isc_base_imponible: float = 0.0  # dBaseImpISC
+    isc_subtotal_gravado: float = 0.0# dSubVISC
 
     # === Estado de procesamiento (ciclo de vida) ===
     # PROCESSING → DONE | PENDING_AI | FAILED
     status: Optional[str] = "DONE"         # Estado de procesamiento de la factura
     processing_error: Optional[str] = None # Mensaje de error si status=FAILED
-    fuente: Optional[str] = ""             # XML | PDF | LINK | AI
+    fuente: str = ""             # XML | PDF | LINK | AI
 
-    actividad_economica: Optional[str] = ""
+    actividad_economica: str = ""
     empresa: Optional[EmpresaData] = None
     timbrado_data: Optional[TimbradoData] = None
     factura_data: Optional[FacturaData] = None
     productos: List[ProductoFactura] = Field(default_factory=list)
     totales: Optional[TotalesData] = None
     cliente: Optional[ClienteData] = None
-    observacion: Optional[str] = ""
+    observacion: str = ""
     created_at: Optional[datetime] = None
 
     @classmethod
     def from_dict(cls, data: dict, email_metadata: dict = None):
+        """Construye la factura validando todos los campos (entrada no confiable: OpenAI, cache)."""
+        return cls(**cls._from_dict_kwargs(data, email_metadata, _validated))
+
+    @classmethod
+    def from_dict_trusted(cls, data: dict, email_metadata: dict = None):
+        """
+        Variante sin revalidación para la salida del parser XML nativo, que ya
+        entrega números como float/int y textos como str. Aplica la misma
+        normalización que from_dict pero arma los modelos con model_construct().
+        """
+        return cls.model_construct(**cls._from_dict_kwargs(data, email_metadata, _constructed))
 
+    @classmethod
+    def _from_dict_kwargs(cls, data: dict, email_metadata: Optional[dict], build) -> Dict[str, Any]:
         fecha_parsed = try_parse_date(data.get("fecha"))
 
         condicion_venta = (data.get("condicion_venta") or "CONTADO").upper()
-        condicion_compra = condicion_venta
-        tipo_documento = "CR" if "CREDITO" in condicion_venta else "CO"
+        condicion_compra = condicion_venta  # mismo valor
+        # Crédito/Contado -> CR/CO ("CREDIT" cubre CREDITO y CREDIT)
+        tipo_documento = "CR" if ("CREDIT" in condicion_venta or "CRÉDIT" in condicion_venta) else "CO"
 
-        moneda = (data.get("moneda") or "GS").upper()
-        if moneda == "PYG":
-            moneda = "GS"
+        # Monedas USD/PYG a valores finales; desconocidas -> GS
+        moneda = _MONEDA_MAP.get((data.get("moneda") or "GS").upper(), "GS")
 
-        # Fallbacks seguros
+        # Submodelos opcionales (solo llegan desde OpenAI); una lectura por clave
         td = data.get("timbrado_data") or {}
         fd = data.get("factura_data") or {}
+        empresa = data.get("empresa")
+        totales = data.get("totales")
+        cliente = data.get("cliente")
 
         timbrado = data.get("timbrado") or td.get("nro") or ""
         cdc = data.get("cdc") or fd.get("cdc") or ""
 
         numero_doc = data.get("numero_factura") or fd.get("contado_nro") or ""
-        
-        fecha_parsed = try_parse_date(data.get("fecha"))
 
-        condicion_venta = (data.get("condicion_venta") or "CONTADO").upper()
-        condicion_compra = condicion_venta  # mismo valor
-        
-        # Fix: mapear correctamente Crédito/Contado a CR/CO
-        tipo_documento = "CR" if any(word in condicion_venta for word in ["CREDITO", "CRÉDITO", "CREDIT"]) else "CO"
-
-        # Fix: mapear correctamente monedas USD/PYG a valores finales
-        moneda = (data.get("moneda") or "GS").upper()
-        if moneda in ["PYG", "GUARANI", "GUARANÍES"]:
-            moneda = "GS"
-        elif moneda in ["USD", "DOLLAR", "DOLAR"]:
-            moneda = "USD"
-        else:
-            # Default para valores desconocidos
-            moneda = "GS"
+        meta = email_metadata or {}
+
+        # Montos que alimentan dos campos (actual + legacy): se convierten una vez
+        subtotal_10 = safe_float(data.get("subtotal_10"))
+        subtotal_5 = safe_float(data.get("subtotal_5"))
+        exento = safe_float(data.get("exento") or data.get("subtotal_exentas"))  # Preferir "exento" del XML
+        monto_total = safe_float(data.get("monto_total"))
 
-        return cls(
+        return dict(
             fecha=fecha_parsed,
             tipo_documento=tipo_documento,
             numero_documento=numero_doc,
-            ruc_proveedor=data.get("ruc_emisor"),
-            razon_social_proveedor=data.get("nombre_emisor"),
+            ruc_proveedor=data.get("ruc_emisor") or "",
+            razon_social_proveedor=data.get("nombre_emisor") or "",
             condicion_compra=condicion_compra,
 
-            gravado_10=safe_float(data.get("subtotal_10")),
+            gravado_10=subtotal_10,
             iva_10=safe_float(data.get("iva_10")),
-            gravado_5=safe_float(data.get("subtotal_5")),
+            gravado_5=subtotal_5,
             iva_5=safe_float(data.get("iva_5")),
-            exento=safe_float(data.get("exento") or data.get("subtotal_exentas")),  # Preferir "exento" del XML
-            total_factura=safe_float(data.get("monto_total")),
+            exento=exento,  # Preferir "exento" del XML
+            total_factura=monto_total,
 
             timbrado=timbrado,
             cdc=cdc,
             moneda=moneda,
             tipo_cambio=safe_float(data.get("tipo_cambio", 0.0)),
 
-            descripcion_factura=data.get("descripcion_factura", ""),
-            direccion_emisor=data.get("direccion_emisor", ""),
-            telefono_emisor=data.get("telefono_emisor", ""),
-            email_emisor=data.get("email_emisor", ""),
+            descripcion_factura=data.get("descripcion_factura") or "",
+            direccion_emisor=data.get("direccion_emisor") or "",
+            telefono_emisor=data.get("telefono_emisor") or "",
+            email_emisor=data.get("email_emisor") or "",
 
-            ruc_emisor=data.get("ruc_emisor"),
-            nombre_emisor=data.get("nombre_emisor"),
-            numero_factura=data.get("numero_factura"),
-            monto_total=safe_float(data.get("monto_total")),
+            ruc_emisor=data.get("ruc_emisor") or "",
+            nombre_emisor=data.get("nombre_emisor") or "",
+            numero_factura=data.get("numero_factura") or "",
+            monto_total=monto_total,
             iva=safe_float(data.get("iva")),
 
-            ruc_cliente=data.get("ruc_cliente"),
-            nombre_cliente=data.get("nombre_cliente"),
-            email_cliente=data.get("email_cliente"),
-            direccion_cliente=data.get("direccion_cliente", ""),
-            telefono_cliente=data.get("telefono_cliente", ""),
+            ruc_cliente=data.get("ruc_cliente") or "",
+            nombre_cliente=data.get("nombre_cliente") or "",
+            email_cliente=data.get("email_cliente") or "",
+            direccion_cliente=data.get("direccion_cliente") or "",
+            telefono_cliente=data.get("telefono_cliente") or "",
             condicion_venta=condicion_venta,
 
-            subtotal_exentas=safe_float(data.get("exento") or data.get("subtotal_exentas")),  # Usar "exento" del XML
-            subtotal_5=safe_float(data.get("subtotal_5")),
-            subtotal_10=safe_float(data.get("subtotal_10")),
+            subtotal_exentas=exento,  # Usar "exento" del XML
+            subtotal_5=subtotal_5,
+            subtotal_10=subtotal_10,
 
             # === CAMPOS CRÍTICOS PARA TEMPLATE EXPORT ===
             base_gravada_5=safe_float(data.get("gravado_5")),  # Mapeo correcto XML
@@ -300,22 +361,22 @@ class InvoiceData(BaseModel):
             anticipo=safe_float(data.get("anticipo")),
 
             # === CAMPOS NUEVOS XSD SIFEN v150 ===
-            qr_url=data.get("qr_url", ""),
-            info_adicional=data.get("info_adicional", ""),
-            tipo_documento_electronico=data.get("tipo_documento_electronico", ""),
-            tipo_de_codigo=data.get("tipo_de_codigo", ""),
-            ind_presencia=data.get("ind_presencia", ""),
-            ind_presencia_codigo=data.get("ind_presencia_codigo", ""),
-            cond_credito=data.get("cond_credito", ""),
-            cond_credito_codigo=data.get("cond_credito_codigo", ""),
+            qr_url=data.get("qr_url") or "",
+            info_adicional=data.get("info_adicional") or "",
+            tipo_documento_electronico=data.get("tipo_documento_electronico") or "",
+            tipo_de_codigo=data.get("tipo_de_codigo") or "",
+            ind_presencia=data.get("ind_presencia") or "",
+            ind_presencia_codigo=data.get("ind_presencia_codigo") or "",
+            cond_credito=data.get("cond_credito") or "",
+            cond_credito_codigo=data.get("cond_credito_codigo") or "",
             plazo_credito_dias=int(data.get("plazo_credito_dias") or 0),
-            ciclo_facturacion=data.get("ciclo_facturacion", ""),
-            ciclo_fecha_inicio=data.get("ciclo_fecha_inicio", ""),
-            ciclo_fecha_fin=data.get("ciclo_fecha_fin", ""),
-            transporte_modalidad=data.get("transporte_modalidad", ""),
-            transporte_modalidad_codigo=data.get("transporte_modalidad_codigo", ""),
-            transporte_resp_flete_codigo=data.get("transporte_resp_flete_codigo", ""),
-            transporte_nro_despacho=data.get("transporte_nro_despacho", ""),
+            ciclo_facturacion=data.get("ciclo_facturacion") or "",
+            ciclo_fecha_inicio=data.get("ciclo_fecha_inicio") or "",
+            ciclo_fecha_fin=data.get("ciclo_fecha_fin") or "",
+            transporte_modalidad=data.get("transporte_modalidad") or "",
+            transporte_modalidad_codigo=data.get("transporte_modalidad_codigo") or "",
+            transporte_resp_flete_codigo=data.get("transporte_resp_flete_codigo") or "",
+            transporte_nro_despacho=data.get("transporte_nro_despacho") or "",
             isc_total=safe_float(data.get("isc_total")),
             isc_base_imponible=safe_float(data.get("isc_base_imponible")),
             isc_subtotal_gravado=safe_float(data.get("isc_subtotal_gravado")),
@@ -323,29 +384,22 @@ class InvoiceData(BaseModel):
             # Estado de procesamiento
             status=data.get("status", "DONE"),
             processing_error=data.get("processing_error"),
-            fuente=data.get("fuente", ""),
-
-            actividad_economica=data.get("actividad_economica"),
-            empresa=EmpresaData(**data["empresa"]) if data.get("empresa") else None,
-            timbrado_data=TimbradoData(**data["timbrado_data"]) if data.get("timbrado_data") else None,
-            factura_data=FacturaData(**data["factura_data"]) if data.get("factura_data") else None,
-            # Normalizar productos: asegurar que 'nombre' exista tomando 'descripcion'/'articulo' si es necesario
-            productos=[
-                (
-                    ProductoFactura(**({**p, 'nombre': (p.get('nombre') or p.get('descripcion') or p.get('articulo') or p.get('codigo') or '')}))
-                    if isinstance(p, dict)
-                    else ProductoFactura(**p.__dict__)
-                )
-                for p in (data.get("productos", []) or [])
-            ],
-            totales=TotalesData(**data["totales"]) if data.get("totales") else None,
-            cliente=ClienteData(**data["cliente"]) if data.get("cliente") else None,
-
-            email_origen=(email_metadata or {}).get("sender"),
+            fuente=data.get("fuente") or "",
+
+            actividad_economica=data.get("actividad_economica") or "",
+            empresa=build(EmpresaData, empresa) if empresa else None,
+            timbrado_data=build(TimbradoData, td) if td else None,
+            factura_data=build(FacturaData, fd) if fd else None,
+            productos=_build_productos(data.get("productos"), build),
+            totales=build(TotalesData, totales) if totales else None,
+            cliente=build(ClienteData, cliente) if cliente else None,
+
+            email_origen=meta.get("sender") or "",
             message_id=(
-                (email_metadata or {}).get("rfc822_message_id")
-                or (email_metadata or {}).get("message_id")
-                or data.get("message_id", "")
+                meta.get("rfc822_message_id")
+                or meta.get("message_id")
+                or data.get("message_id")
+                or ""
             ),
             mes_proceso=fecha_parsed.strftime("%Y-%m") if fecha_parsed else datetime.now().strftime("%Y-%m"),
             created_at=data.get("created_at") if isinstance(data.get("created_at"), datetime) else None,
@@ -403,6 +457,14 @@ class EmailConfigUpdate(BaseModel):
     provider: Optional[str] = None
     enabled: Optional[bool] = None
 
+# Términos de búsqueda por defecto (tupla inmutable; cada config recibe su propia lista).
+_DEFAULT_SEARCH_TERMS = (
+    "factura", "facturacion", "factura electronica", "comprobante",
+    "Documento Electronico", "Documento electronico",
+    "documento electrónico", "documento electronico",
+    "DOCUMENTO ELECTRONICO", "DOCUMENTO ELECTRÓNICO",
+)
+
 class EmailConfig(BaseModel):
     model_config = ConfigDict(populate_by_name=True)
     host: str
@@ -410,12 +472,7 @@ class EmailConfig(BaseModel):
     username: str
     password: str
     search_criteria: str = "UNSEEN"
-    search_terms: List[str] = Field(default_factory=lambda: [
-        "factura", "facturacion", "factura electronica", "comprobante",
-        "Documento Electronico", "Documento electronico",
-        "documento electrónico", "documento electronico",
-        "DOCUMENTO ELECTRONICO", "DOCUMENTO ELECTRÓNICO"
-    ])
+    search_terms: List[str] = Field(default_factory=lambda: list(_DEFAULT_SEARCH_TERMS))
     search_synonyms: Optional[Dict[str, List[str]] | List[str]] = None
     fallback_sender_match: bool = False
     fallback_attachment_match: bool = False
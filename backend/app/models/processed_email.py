@@ -2,6 +2,8 @@ from datetime import datetime
 from typing import Optional
 from pydantic import BaseModel, Field, ConfigDict
 
+from app.utils.date_utils import coarse_utcnow
+
 class ProcessedEmail(BaseModel):
     """
     Registro de correo procesado en MongoDB para soportar escalado horizontal.
@@ -24,7 +26,7 @@ class ProcessedEmail(BaseModel):
     sender: Optional[str] = None
     email_date: Optional[datetime] = None
     
-    processed_at: datetime = Field(default_factory=datetime.utcnow)
+    processed_at: datetime = Field(default_factory=coarse_utcnow)
     
     # Metadatos para retries
     retry_count: int = 0
@@ -1,25 +1,86 @@
 import logging
 import uuid
 import base64
+import copy
+import functools
 import hashlib
 import os
-from typing import List, Dict, Any, Optional
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime, timezone
+from typing import List, Dict, Any, Optional, Set, Tuple
 
-from pymongo import MongoClient
+from pymongo import IndexModel, MongoClient, ReturnDocument, UpdateOne
 from pymongo.collection import Collection
+from pymongo.read_preferences import ReadPreference
 from cryptography.fernet import Fernet, InvalidToken
 
 from app.config.settings import settings
+from app.modules.oauth import google_oauth
+from app.repositories import user_repository
 
 logger = logging.getLogger(__name__)
 
 COLLECTION_NAME = "email_configs"
 SENSITIVE_FIELDS = ("password", "access_token", "refresh_token")
+_SENSITIVE_SET = frozenset(SENSITIVE_FIELDS)
 ENCRYPTION_PREFIX = "enc:v1:"
+_PREFIX_LEN = len(ENCRYPTION_PREFIX)
 _FERNET: Optional[Fernet] = None
+_FERNET_LOCK = threading.Lock()
 _WARNED_FALLBACK_KEY = False
 _FALLBACK_WARN_SENTINEL = "/tmp/cuenly_email_config_key_warning_logged"
 
+_CLIENT: Optional[MongoClient] = None
+_CLIENT_PID: Optional[int] = None
+_CLIENT_LOCK = threading.Lock()
+_INDEXES_READY = False
+# (owner_email, enabled): sirve a get_enabled_configs por tenant y, por prefijo, a
+# todas las consultas solo por owner_email. Solo se usa como hint si create_indexes
+# terminó bien en este proceso.
+_OWNER_INDEX = [("owner_email", 1), ("enabled", 1)]
+_OWNER_INDEX_READY = False
+_OWNER_USERNAME_INDEX = [("owner_email", 1), ("username", 1)]
+_OWNER_USERNAME_INDEX_READY = False
+# (cliente, colección) para no reconstruir client[db][coll] en cada operación
+_COLLECTION: Optional[Tuple[MongoClient, Collection]] = None
+_USER_REPO: Optional["user_repository.UserRepository"] = None
+_USER_REPO_PID: Optional[int] = None
+_OAUTH_REFRESH_MAX_WORKERS = 8
+_CURSOR_BATCH_SIZE = 100
+
+# Pre-refresh en segundo plano de tokens OAuth2 que vencen pronto (aún válidos)
+_PREREFRESH_WINDOW_SECONDS = 300
+_BG_REFRESH_MAX_WORKERS = 4
+_BG_REFRESH_EXECUTOR: Optional[ThreadPoolExecutor] = None
+_BG_REFRESH_PID: Optional[int] = None
+_BG_REFRESH_INFLIGHT: Set[str] = set()
+_BG_REFRESH_LOCK = threading.Lock()
+
+# Caché en proceso de get_enabled_configs (se consulta en cada tick del scheduler).
+# Clave: (owner_email, include_password, check_trial, refresh_oauth_tokens) -> (vence_en, configs)
+_ENABLED_CACHE: Dict[Tuple[Any, ...], Tuple[float, List[Dict[str, Any]]]] = {}
+_ENABLED_CACHE_TTL = 30.0
+# Tras una escritura local, get_enabled_configs lee del primario durante un TTL:
+# un secundario atrasado no debe quedar cacheado como resultado "fresco".
+_PRIMARY_READS_UNTIL = 0.0
+
+# Campos que leen los listados; los secretos se agregan solo cuando se van a devolver.
+_BASE_PROJECTION: Dict[str, int] = {
+    field: 1 for field in (
+        "name", "host", "port", "username", "use_ssl", "search_criteria", "search_terms",
+        "search_synonyms", "fallback_sender_match", "fallback_attachment_match", "provider",
+        "enabled", "owner_email", "auth_type", "token_expiry",
+    )
+}
+
+
+def _projection(include_secrets: bool) -> Dict[str, int]:
+    if not include_secrets:
+        return _BASE_PROJECTION
+    return {**_BASE_PROJECTION, **{field: 1 for field in SENSITIVE_FIELDS}}
+
 
 def _should_emit_fallback_key_warning() -> bool:
     """
@@ -75,13 +136,18 @@ def _build_fernet() -> Fernet:
 
 def _get_fernet() -> Fernet:
     global _FERNET
-    if _FERNET is None:
-        _FERNET = _build_fernet()
-    return _FERNET
+    fernet = _FERNET
+    if fernet is None:
+        # Doble chequeo: un solo hilo construye el cifrador en el primer uso concurrente
+        with _FERNET_LOCK:
+            fernet = _FERNET
+            if fernet is None:
+                fernet = _FERNET = _build_fernet()
+    return fernet
 
 
 def _is_encrypted(value: Any) -> bool:
-    return isinstance(value, str) and value.startswith(ENCRYPTION_PREFIX)
+    return type(value) is str and value[:_PREFIX_LEN] == ENCRYPTION_PREFIX
 
 
 def _encrypt_secret(value: Any) -> str:
@@ -94,6 +160,17 @@ def _encrypt_secret(value: Any) -> str:
     return f"{ENCRYPTION_PREFIX}{token}"
 
 
+@functools.lru_cache(maxsize=1024)
+def _decrypt_token(value: str) -> str:
+    """
+    Descifrado memoizado por texto cifrado: cada token Fernet es inmutable, así que
+    los listados repetidos no vuelven a pagar HMAC + AES. Un secreto nuevo implica
+    un token nuevo, por lo que no hace falta invalidar. Los errores no se cachean.
+    """
+    token = value[_PREFIX_LEN:]
+    return _get_fernet().decrypt(token.encode("utf-8")).decode("utf-8")
+
+
 def _decrypt_secret(value: Any) -> str:
     if value in (None, ""):
         return ""
@@ -102,212 +179,397 @@ def _decrypt_secret(value: Any) -> str:
     if not _is_encrypted(value):
         # Compatibilidad con registros legacy sin cifrar.
         return value
-    token = value[len(ENCRYPTION_PREFIX):]
     try:
-        return _get_fernet().decrypt(token.encode("utf-8")).decode("utf-8")
+        return _decrypt_token(value)
     except InvalidToken:
         logger.error("No se pudo descifrar secreto de email config (token inválido).")
         return ""
 
 
 def _encrypt_payload_secrets(payload: Dict[str, Any]) -> Dict[str, Any]:
-    for field in SENSITIVE_FIELDS:
-        if field in payload:
-            payload[field] = _encrypt_secret(payload.get(field))
+    # Intersección de claves: payloads sin secretos (p.ej. solo toggles) salen sin recorrer nada
+    for field in _SENSITIVE_SET & payload.keys():
+        payload[field] = _encrypt_secret(payload[field])
     return payload
 
 
 def _get_client() -> MongoClient:
-    mongo_url = getattr(settings, "MONGODB_URL", None) or "mongodb://localhost:27017/"
-    client = MongoClient(
-        mongo_url,
-        serverSelectionTimeoutMS=60000,
-        connectTimeoutMS=60000,
-        socketTimeoutMS=120000,
-        maxPoolSize=30,  # Aumentado para mejor concurrencia
-        minPoolSize=3,   # Mínimo más alto para conexiones ready
-    )
-    # smoke test
-    client.admin.command("ping")
-    return client
-
-
-def _get_collection() -> Collection:
-    client = _get_client()
-    db_name = getattr(settings, "MONGODB_DATABASE", "cuenlyapp_warehouse")
-    db = client[db_name]
-    coll = db[COLLECTION_NAME]
+    """
+    Cliente Mongo compartido por proceso (PyMongo ya mantiene su propio pool y
+    conecta de forma lazy). Se recrea tras un fork: los workers RQ corren cada
+    job en un proceso hijo y MongoClient no es fork-safe.
+    """
+    global _CLIENT, _CLIENT_PID
+    pid = os.getpid()
+    if _CLIENT is None or _CLIENT_PID != pid:
+        with _CLIENT_LOCK:
+            if _CLIENT is None or _CLIENT_PID != pid:
+                mongo_url = getattr(settings, "MONGODB_URL", None) or "mongodb://localhost:27017/"
+                _CLIENT = MongoClient(
+                    mongo_url,
+                    serverSelectionTimeoutMS=60000,
+                    connectTimeoutMS=60000,
+                    socketTimeoutMS=120000,
+                    maxPoolSize=30,  # Aumentado para mejor concurrencia
+                    minPoolSize=3,   # Mínimo más alto para conexiones ready
+                )
+                _CLIENT_PID = pid
+    return _CLIENT
+
+
+def _ensure_indexes(coll: Collection) -> None:
+    global _OWNER_INDEX_READY, _OWNER_USERNAME_INDEX_READY
     try:
-        coll.create_index("username")
-        coll.create_index("owner_email")
-        coll.create_index([("enabled", 1)])
-        coll.create_index([("provider", 1)])
-    except Exception:
-        pass
+        # Un solo comando createIndexes para los índices simples
+        coll.create_indexes([
+            IndexModel([("username", 1)]),
+            IndexModel(_OWNER_INDEX),
+            # get_enabled_configs sin tenant (scheduler) filtra solo {enabled}
+            IndexModel([("enabled", 1)]),
+            IndexModel([("provider", 1)]),
+        ])
+        _OWNER_INDEX_READY = True
+    except Exception as e:
+        logger.warning(f"No se pudieron crear índices de email_configs: {e}")
     try:
         # Unicidad por tenant; puede fallar si ya existen datos duplicados legacy.
-        coll.create_index([("owner_email", 1), ("username", 1)], unique=True)
+        coll.create_index(_OWNER_USERNAME_INDEX, unique=True)
+        _OWNER_USERNAME_INDEX_READY = True
     except Exception as e:
         logger.warning(f"No se pudo crear índice único owner_email+username: {e}")
+
+
+def _get_user_repo() -> "user_repository.UserRepository":
+    """UserRepository por proceso: su MongoClient (y el ping inicial) se reutilizan entre llamadas."""
+    global _USER_REPO, _USER_REPO_PID
+    pid = os.getpid()
+    if _USER_REPO is None or _USER_REPO_PID != pid:
+        _USER_REPO = user_repository.UserRepository()
+        _USER_REPO_PID = pid
+    return _USER_REPO
+
+
+def _get_collection() -> Collection:
+    global _INDEXES_READY, _COLLECTION
+    client = _get_client()
+    cached = _COLLECTION
+    if cached is not None and cached[0] is client:
+        coll = cached[1]
+    else:
+        db_name = getattr(settings, "MONGODB_DATABASE", "cuenlyapp_warehouse")
+        coll = client[db_name][COLLECTION_NAME]
+        _COLLECTION = (client, coll)
+    if not _INDEXES_READY:
+        # Una vez por proceso: los create_index son idempotentes pero cuestan un round-trip cada uno.
+        _ensure_indexes(coll)
+        _INDEXES_READY = True
     return coll
 
 
+def _parse_token_expiry(value: Any) -> Optional[datetime]:
+    """token_expiry guardado (ISO string o datetime) -> datetime naive en UTC, o None."""
+    if isinstance(value, datetime):
+        return _to_naive_utc(value)
+    if not value or not isinstance(value, str):
+        return None
+    return _parse_token_expiry_str(value)
+
+
+def _to_naive_utc(expiry: datetime) -> datetime:
+    if expiry.tzinfo is not None:
+        # Convertir a naive UTC para comparar con utcnow()
+        expiry = expiry.astimezone(timezone.utc).replace(tzinfo=None)
+    return expiry
+
+
+@functools.lru_cache(maxsize=1024)
+def _parse_token_expiry_str(value: str) -> Optional[datetime]:
+    # Memoizado: entre polls la mayoría de los vencimientos no cambian
+    try:
+        # Python 3.11+: fromisoformat acepta cualquier ISO 8601, incluido el sufijo 'Z'
+        return _to_naive_utc(datetime.fromisoformat(value))
+    except ValueError as parse_err:
+        logger.warning(f"Error parseando token_expiry '{value}': {parse_err}")
+        return None
+
+
+def _normalize_token_expiry(value: Any) -> str:
+    """Forma canónica al persistir: ISO naive UTC (la que produce calculate_token_expiry)."""
+    expiry = _parse_token_expiry(value)
+    return expiry.isoformat() if expiry else (value or "")
+
+
+def _norm_email(email: Optional[str]) -> Optional[str]:
+    """owner_email normalizado (se guarda siempre en minúsculas); None si viene vacío."""
+    return email.lower() if email else None
+
+
+def _doc_to_cfg(d: Dict[str, Any], include_password: bool, include_owner: bool = False) -> Dict[str, Any]:
+    """Documento Mongo -> dict de configuración (forma común de todos los lectores)."""
+    get = d.get
+    token_expiry = get("token_expiry")
+    cfg = {
+        "id": str(get("_id")),
+        "name": get("name") or "",
+        "host": get("host") or "",
+        "port": int(get("port") or 993),
+        "username": get("username") or "",
+        "use_ssl": bool(get("use_ssl", True)),
+        "search_criteria": get("search_criteria") or "UNSEEN",
+        "search_terms": get("search_terms") or [],
+        "search_synonyms": get("search_synonyms") or {},
+        "fallback_sender_match": bool(get("fallback_sender_match", False)),
+        "fallback_attachment_match": bool(get("fallback_attachment_match", False)),
+        "provider": get("provider") or "other",
+        "enabled": bool(get("enabled", True)),
+        # OAuth fields
+        "auth_type": get("auth_type") or "password",
+        # Nunca exponer tokens al frontend cuando include_password=False
+        "access_token": _decrypt_secret(get("access_token")) if include_password else "",
+        "refresh_token": _decrypt_secret(get("refresh_token")) if include_password else "",
+        "token_expiry": token_expiry.isoformat() if isinstance(token_expiry, datetime) else (token_expiry or ""),
+    }
+    if include_owner:
+        cfg["owner_email"] = get("owner_email", "")
+    if include_password:
+        cfg["password"] = _decrypt_secret(get("password"))
+    return cfg
+
+
+def _read_collection() -> Collection:
+    """
+    Colección para lecturas que toleran algo de retraso (el poller ya cachea
+    hasta _ENABLED_CACHE_TTL): en un replica set se sirven desde un secundario.
+    Sin réplicas se comporta igual que _get_collection(). No usar justo después
+    de una escritura propia (ver _PRIMARY_READS_UNTIL).
+    """
+    return _get_collection().with_options(read_preference=ReadPreference.SECONDARY_PREFERRED)
+
+
 def list_configs(include_password: bool = False, owner_email: Optional[str] = None) -> List[Dict[str, Any]]:
     """List all email configurations. Password is omitted by default."""
     coll = _get_collection()
     query: Dict[str, Any] = {}
     if owner_email:
-        query['owner_email'] = owner_email.lower()
-    docs = list(coll.find(query))
+        query['owner_email'] = _norm_email(owner_email)
+    # Iterar el cursor por lotes en vez de materializar todos los documentos
+    cursor = coll.find(query, _projection(include_password)).batch_size(_CURSOR_BATCH_SIZE)
     results: List[Dict[str, Any]] = []
-    for d in docs:
-        item = {
-            "id": str(d.get("_id")),
-            "name": d.get("name") or "",
-            "host": d.get("host") or "",
-            "port": int(d.get("port") or 993),
-            "username": d.get("username") or "",
-            "use_ssl": bool(d.get("use_ssl", True)),
-            "search_criteria": d.get("search_criteria") or "UNSEEN",
-            "search_terms": d.get("search_terms") or [],
-            "search_synonyms": d.get("search_synonyms") or {},
-            "fallback_sender_match": bool(d.get("fallback_sender_match", False)),
-            "fallback_attachment_match": bool(d.get("fallback_attachment_match", False)),
-            "provider": d.get("provider") or "other",
-            "enabled": bool(d.get("enabled", True)),
-            # OAuth fields
-            "auth_type": d.get("auth_type") or "password",
-            # Nunca exponer tokens al frontend cuando include_password=False
-            "access_token": _decrypt_secret(d.get("access_token")) if include_password else "",
-            "refresh_token": _decrypt_secret(d.get("refresh_token")) if include_password else "",
-            "token_expiry": d.get("token_expiry") or "",
-        }
-        if include_password:
-            item["password"] = _decrypt_secret(d.get("password"))
-        results.append(item)
+    for d in cursor:
+        results.append(_doc_to_cfg(d, include_password))
     return results
 
 
+def _refresh_one(oauth_manager: Any, refresh_token: str) -> Tuple[str, str]:
+    """Un refresh contra Google -> (access_token, token_expiry_iso)."""
+    tokens = oauth_manager.refresh_access_token_sync(refresh_token)
+    new_expiry = oauth_manager.calculate_token_expiry(tokens.get("expires_in", 3600))
+    return tokens.get("access_token"), new_expiry.isoformat()
+
+
+def _refresh_oauth_tokens(oauth_manager: Any, expired: Dict[str, Tuple[str, str]]) -> Dict[str, Tuple[str, str]]:
+    """
+    Refresca en paralelo los tokens OAuth2 expirados ({config_id: (username, refresh_token)}).
+    Cada refresh es un round-trip HTTPS a Google: el tiempo total pasa a ser el del más lento.
+    Devuelve {config_id: (access_token, token_expiry_iso)} solo para los refrescos exitosos.
+    """
+    refreshed: Dict[str, Tuple[str, str]] = {}
+    workers = min(_OAUTH_REFRESH_MAX_WORKERS, len(expired))
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="oauth-refresh") as pool:
+        futures = {
+            pool.submit(_refresh_one, oauth_manager, refresh_token): (config_id, username)
+            for config_id, (username, refresh_token) in expired.items()
+        }
+        for future in as_completed(futures):
+            config_id, username = futures[future]
+            try:
+                refreshed[config_id] = future.result()
+                logger.info(f"✅ Token OAuth2 refrescado exitosamente para {username}")
+            except Exception as refresh_error:
+                logger.error(f"❌ Error refrescando token OAuth2 para {username}: {refresh_error}")
+                # Continuar con el token expirado, la conexión fallará
+    return refreshed
+
+
+def _refresh_and_persist(oauth_manager: Any, config_id: str, username: str, refresh_token: str) -> None:
+    try:
+        new_access_token, new_expiry = _refresh_one(oauth_manager, refresh_token)
+        _get_collection().update_one(
+            {"_id": config_id},
+            {"$set": {"access_token": _encrypt_secret(new_access_token), "token_expiry": new_expiry}},
+        )
+        _invalidate_enabled_cache()
+        logger.info(f"✅ Token OAuth2 pre-refrescado en segundo plano para {username}")
+    except Exception as e:
+        logger.warning(f"⚠️ Pre-refresh de token OAuth2 falló para {username}: {e}")
+    finally:
+        with _BG_REFRESH_LOCK:
+            _BG_REFRESH_INFLIGHT.discard(config_id)
+
+
+def _schedule_background_refresh(oauth_manager: Any, config_id: str, username: str, refresh_token: str) -> None:
+    """
+    Encola el refresh de un token que vence pronto sin bloquear al llamador; a lo
+    sumo uno en curso por configuración. El executor se recrea tras un fork
+    (los hilos no sobreviven al fork de los workers RQ). Si el proceso termina
+    antes, el token se refresca de forma síncrona al vencer.
+    """
+    global _BG_REFRESH_EXECUTOR, _BG_REFRESH_PID
+    with _BG_REFRESH_LOCK:
+        pid = os.getpid()
+        if _BG_REFRESH_EXECUTOR is None or _BG_REFRESH_PID != pid:
+            _BG_REFRESH_EXECUTOR = ThreadPoolExecutor(
+                max_workers=_BG_REFRESH_MAX_WORKERS, thread_name_prefix="oauth-prerefresh"
+            )
+            _BG_REFRESH_PID = pid
+            _BG_REFRESH_INFLIGHT.clear()
+        if config_id in _BG_REFRESH_INFLIGHT:
+            return
+        _BG_REFRESH_INFLIGHT.add(config_id)
+        _BG_REFRESH_EXECUTOR.submit(_refresh_and_persist, oauth_manager, config_id, username, refresh_token)
+
+
+def _invalidate_enabled_cache() -> None:
+    global _PRIMARY_READS_UNTIL
+    _PRIMARY_READS_UNTIL = time.monotonic() + _ENABLED_CACHE_TTL
+    _ENABLED_CACHE.clear()
+
+
 def get_enabled_configs(include_password: bool = True, owner_email: Optional[str] = None, check_trial: bool = False, refresh_oauth_tokens: bool = True) -> List[Dict[str, Any]]:
+    """
+    Configuraciones habilitadas, con caché de hasta _ENABLED_CACHE_TTL segundos.
+    Los mutadores de este módulo invalidan la caché; cambios hechos desde otro
+    proceso se ven, como mucho, al vencer el TTL.
+    """
+    owner_email = _norm_email(owner_email)
+    key = (owner_email, include_password, check_trial, refresh_oauth_tokens)
+    now = time.monotonic()
+    cached = _ENABLED_CACHE.get(key)
+    if cached:
+        if cached[0] > now:
+            return copy.deepcopy(cached[1])
+        # Vencida: no retener copias (con secretos descifrados) más allá del TTL
+        _ENABLED_CACHE.pop(key, None)
+    configs, cache_for = _load_enabled_configs(include_password, owner_email, check_trial, refresh_oauth_tokens)
+    if cache_for > 0:
+        _prune_enabled_cache(now)
+        _ENABLED_CACHE[key] = (now + cache_for, copy.deepcopy(configs))
+    return configs
+
+
+def _prune_enabled_cache(now: float) -> None:
+    """Descarta las entradas vencidas de otras combinaciones (dueño, flags)."""
+    for key, (deadline, _) in list(_ENABLED_CACHE.items()):
+        if deadline <= now:
+            _ENABLED_CACHE.pop(key, None)
+
+
+def _load_enabled_configs(include_password: bool, owner_email: Optional[str], check_trial: bool, refresh_oauth_tokens: bool) -> Tuple[List[Dict[str, Any]], float]:
+    """Devuelve (configs, segundos que el resultado puede cachearse)."""
     coll = _get_collection()
+    read_coll = coll if time.monotonic() < _PRIMARY_READS_UNTIL else _read_collection()
     q: Dict[str, Any] = {"enabled": True}
     if owner_email:
-        q['owner_email'] = owner_email.lower()
-    docs = list(coll.find(q))
+        # Ya normalizado por get_enabled_configs
+        q['owner_email'] = owner_email
+    # El refresh OAuth necesita los tokens aunque no se devuelvan al llamador
+    cursor = read_coll.find(q, _projection(include_password or refresh_oauth_tokens)).batch_size(_CURSOR_BATCH_SIZE)
     configs = []
     
     # Si se solicita verificación de trial, filtrar por usuarios con acceso válido
+    # (una sola consulta para todos los dueños en vez de una por configuración)
+    trial_infos: Dict[str, Dict[str, Any]] = {}
     if check_trial:
-        from app.repositories.user_repository import UserRepository
-        user_repo = UserRepository()
+        owners = [owner_email] if owner_email else read_coll.distinct("owner_email", q)
+        trial_infos = _get_user_repo().get_trial_info_bulk(owners)
     
     # OAuth manager para refrescar tokens expirados
     oauth_manager = None
     if refresh_oauth_tokens:
         try:
-            from app.modules.oauth.google_oauth import get_google_oauth_manager
-            oauth_manager = get_google_oauth_manager()
+            oauth_manager = google_oauth.get_google_oauth_manager()
         except Exception as e:
             logger.warning(f"No se pudo cargar OAuth manager: {e}")
     
-    for d in docs:
+    # No cachear más allá del vencimiento del primer token vigente, ni resultados
+    # con tokens que no se pudieron refrescar.
+    cache_for = _ENABLED_CACHE_TTL if (oauth_manager or not refresh_oauth_tokens) else 0.0
+    # Tokens expirados a refrescar en paralelo: {config_id: (username, refresh_token)}
+    expired: Dict[str, Tuple[str, str]] = {}
+    expired_cfgs: Dict[str, Dict[str, Any]] = {}
+    for d in cursor:
         # Verificar trial si está habilitado
         if check_trial:
             config_owner = d.get('owner_email', '').lower()
             if config_owner:
-                trial_info = user_repo.get_trial_info(config_owner)
+                trial_info = trial_infos.get(config_owner) or _get_user_repo().get_trial_info(config_owner)
                 if trial_info['is_trial_user'] and trial_info['trial_expired']:
                     logger.info(f"Omitiendo configuración de {config_owner} - trial expirado")
                     continue
         
+        cfg = _doc_to_cfg(d, include_password, include_owner=True)
+        configs.append(cfg)
+
+        if not refresh_oauth_tokens or cfg["auth_type"] != "oauth2":
+            continue
         # Obtener tokens OAuth actuales
-        auth_type = d.get("auth_type") or "password"
-        access_token = _decrypt_secret(d.get("access_token"))
-        token_expiry_str = d.get("token_expiry") or ""
-        refresh_token = _decrypt_secret(d.get("refresh_token"))
-        password = _decrypt_secret(d.get("password"))
-        config_id = str(d.get("_id"))
-        username = d.get("username") or ""
+        token_expiry_str = cfg["token_expiry"]
+        config_id = cfg["id"]
+        username = cfg["username"]
+        refresh_token = cfg["refresh_token"] if include_password else _decrypt_secret(d.get("refresh_token"))
         
-        # 🔄 AUTO-REFRESH: Si es OAuth2 y el token está expirado, refrescarlo
-        if refresh_oauth_tokens and oauth_manager and auth_type == "oauth2" and refresh_token:
+        # 🔄 AUTO-REFRESH: Si es OAuth2 y el token está expirado, se refresca tras el recorrido
+        needs_refresh = False
+        if oauth_manager and refresh_token:
             try:
-                from datetime import datetime, timezone
-                token_expiry = None
-                if token_expiry_str:
-                    try:
-                        # Manejar varios formatos de fecha ISO
-                        expiry_str = token_expiry_str.replace('Z', '+00:00')
-                        if '+' not in expiry_str and '-' not in expiry_str[-6:]:
-                            # Sin timezone, asumir UTC
-                            token_expiry = datetime.fromisoformat(expiry_str)
-                        else:
-                            # Con timezone
-                            token_expiry = datetime.fromisoformat(expiry_str)
-                            # Convertir a naive UTC para comparar con utcnow()
-                            if token_expiry.tzinfo is not None:
-                                token_expiry = token_expiry.replace(tzinfo=None)
-                    except Exception as parse_err:
-                        logger.warning(f"Error parseando token_expiry '{token_expiry_str}': {parse_err}")
-                        token_expiry = None
-                
+                token_expiry = _parse_token_expiry(token_expiry_str)
                 is_expired = oauth_manager.is_token_expired(token_expiry)
                 logger.info(f"🔍 OAuth2 check para {username}: token_expiry={token_expiry}, is_expired={is_expired}")
                 
                 if is_expired:
                     logger.info(f"🔄 Token OAuth2 expirado para {username}, refrescando...")
-                    try:
-                        tokens = oauth_manager.refresh_access_token_sync(refresh_token)
-                        new_access_token = tokens.get("access_token")
-                        expires_in = tokens.get("expires_in", 3600)
-                        new_expiry = oauth_manager.calculate_token_expiry(expires_in)
-                        
-                        # Actualizar en la base de datos
-                        coll.update_one(
-                            {"_id": config_id},
-                            {"$set": {
-                                "access_token": _encrypt_secret(new_access_token),
-                                "token_expiry": new_expiry.isoformat()
-                            }}
-                        )
-                        
-                        # Usar el nuevo token
-                        access_token = new_access_token
-                        token_expiry_str = new_expiry.isoformat()
-                        logger.info(f"✅ Token OAuth2 refrescado exitosamente para {username}")
-                        
-                    except Exception as refresh_error:
-                        logger.error(f"❌ Error refrescando token OAuth2 para {username}: {refresh_error}")
-                        # Continuar con el token expirado, la conexión fallará
+                    needs_refresh = True
+                else:
+                    remaining = (token_expiry - datetime.utcnow()).total_seconds()
+                    cache_for = min(cache_for, remaining)
+                    if remaining < _PREREFRESH_WINDOW_SECONDS:
+                        # Aún válido: se usa el actual y se renueva sin bloquear este tick
+                        _schedule_background_refresh(oauth_manager, config_id, username, refresh_token)
                         
             except Exception as e:
                 logger.warning(f"Error verificando expiración de token para {username}: {e}")
         
-        cfg = {
-            "id": config_id,
-            "name": d.get("name") or "",
-            "host": d.get("host") or "",
-            "port": int(d.get("port") or 993),
-            "username": username,
-            "use_ssl": bool(d.get("use_ssl", True)),
-            "search_criteria": d.get("search_criteria") or "UNSEEN",
-            "search_terms": d.get("search_terms") or [],
-            "search_synonyms": d.get("search_synonyms") or {},
-            "fallback_sender_match": bool(d.get("fallback_sender_match", False)),
-            "fallback_attachment_match": bool(d.get("fallback_attachment_match", False)),
-            "provider": d.get("provider") or "other",
-            "enabled": True,
-            "owner_email": d.get("owner_email", ""),
-            # OAuth fields (posiblemente actualizados)
-            "auth_type": auth_type,
-            "access_token": access_token if include_password else "",
-            "refresh_token": refresh_token if include_password else "",
-            "token_expiry": token_expiry_str,
-        }
-        if include_password:
-            cfg["password"] = password
-        configs.append(cfg)
-    return configs
+        if needs_refresh:
+            expired[config_id] = (username, refresh_token)
+            expired_cfgs[config_id] = cfg
+
+    pending_updates: List[UpdateOne] = []
+    if expired:
+        refreshed = _refresh_oauth_tokens(oauth_manager, expired)
+        if len(refreshed) < len(expired):
+            cache_for = 0.0
+        for config_id, (new_access_token, new_expiry) in refreshed.items():
+            # Usar el nuevo token
+            cfg = expired_cfgs[config_id]
+            cfg["token_expiry"] = new_expiry
+            if include_password:
+                cfg["access_token"] = new_access_token
+            # Persistir en lote al final del recorrido
+            pending_updates.append(UpdateOne(
+                {"_id": config_id},
+                {"$set": {
+                    "access_token": _encrypt_secret(new_access_token),
+                    "token_expiry": new_expiry
+                }}
+            ))
+
+    if pending_updates:
+        # Un solo round-trip para todos los tokens refrescados
+        try:
+            coll.bulk_write(pending_updates, ordered=False)
+        except Exception as e:
+            logger.error(f"❌ Error guardando {len(pending_updates)} token(s) OAuth2 refrescados: {e}")
+    return configs, cache_for
 
 
 def create_config(data: Dict[str, Any], owner_email: Optional[str] = None) -> str:
@@ -334,10 +596,11 @@ def create_config(data: Dict[str, Any], owner_email: Optional[str] = None) -> st
         "auth_type": data.get("auth_type") or "password",
         "access_token": data.get("access_token") or "",
         "refresh_token": data.get("refresh_token") or "",
-        "token_expiry": data.get("token_expiry") or "",
+        "token_expiry": _normalize_token_expiry(data.get("token_expiry")),
     }
     payload = _encrypt_payload_secrets(payload)
     coll.insert_one(payload)
+    _invalidate_enabled_cache()
     return str(payload["_id"]) 
 
 
@@ -367,15 +630,16 @@ def update_config(config_id: str, data: Dict[str, Any], owner_email: Optional[st
     ]:
         if key in data:
             updates[key] = data[key]
-    for secret_field in SENSITIVE_FIELDS:
-        if secret_field in updates:
-            updates[secret_field] = _encrypt_secret(updates.get(secret_field))
+    if "token_expiry" in updates:
+        updates["token_expiry"] = _normalize_token_expiry(updates["token_expiry"])
+    _encrypt_payload_secrets(updates)
     if not updates:
         return False
     q = {"_id": config_id}
     if owner_email:
-        q['owner_email'] = owner_email.lower()
+        q['owner_email'] = _norm_email(owner_email)
     res = coll.update_one(q, {"$set": updates})
+    _invalidate_enabled_cache()
     return res.matched_count > 0
 
 
@@ -383,8 +647,9 @@ def delete_config(config_id: str, owner_email: Optional[str] = None) -> bool:
     coll = _get_collection()
     q = {"_id": config_id}
     if owner_email:
-        q['owner_email'] = owner_email.lower()
+        q['owner_email'] = _norm_email(owner_email)
     res = coll.delete_one(q)
+    _invalidate_enabled_cache()
     return res.deleted_count > 0
 
 
@@ -392,8 +657,9 @@ def set_enabled(config_id: str, enabled: bool, owner_email: Optional[str] = None
     coll = _get_collection()
     q = {"_id": config_id}
     if owner_email:
-        q['owner_email'] = owner_email.lower()
+        q['owner_email'] = _norm_email(owner_email)
     res = coll.update_one(q, {"$set": {"enabled": bool(enabled)}})
+    _invalidate_enabled_cache()
     return res.matched_count > 0
 
 
@@ -401,86 +667,67 @@ def toggle_enabled(config_id: str, owner_email: Optional[str] = None) -> Optiona
     coll = _get_collection()
     q = {"_id": config_id}
     if owner_email:
-        q['owner_email'] = owner_email.lower()
-    doc = coll.find_one(q, {"enabled": 1})
+        q['owner_email'] = _norm_email(owner_email)
+    # Negación atómica en el servidor (update con pipeline, MongoDB 4.2+): un solo
+    # round-trip y sin carrera entre lectura y escritura. Ausente cuenta como habilitado.
+    doc = coll.find_one_and_update(
+        q,
+        [{"$set": {"enabled": {"$not": [{"$ifNull": ["$enabled", True]}]}}}],
+        projection={"enabled": 1},
+        return_document=ReturnDocument.AFTER,
+    )
+    _invalidate_enabled_cache()
     if not doc:
         return None
-    new_val = not bool(doc.get("enabled", True))
-    coll.update_one(q, {"$set": {"enabled": new_val}})
-    return new_val
+    return bool(doc.get("enabled"))
 
 
 def get_by_id(config_id: str, include_password: bool = True, owner_email: Optional[str] = None) -> Optional[Dict[str, Any]]:
     coll = _get_collection()
-    projection = None if include_password else {"password": 0}
     q = {"_id": config_id}
     if owner_email:
-        q['owner_email'] = owner_email.lower()
-    d = coll.find_one(q, projection)
+        q['owner_email'] = _norm_email(owner_email)
+    d = coll.find_one(q, _projection(include_password))
     if not d:
         return None
-    return {
-        "id": str(d.get("_id")),
-        "name": d.get("name"),
-        "host": d.get("host"),
-        "port": int(d.get("port", 993)),
-        "username": d.get("username"),
-        "password": _decrypt_secret(d.get("password")) if include_password else None,
-        "use_ssl": bool(d.get("use_ssl", True)),
-        "search_criteria": d.get("search_criteria") or "UNSEEN",
-        "search_terms": d.get("search_terms") or [],
-        "search_synonyms": d.get("search_synonyms") or {},
-        "fallback_sender_match": bool(d.get("fallback_sender_match", False)),
-        "fallback_attachment_match": bool(d.get("fallback_attachment_match", False)),
-        "provider": d.get("provider") or "other",
-        "enabled": bool(d.get("enabled", True)),
-        # OAuth fields
-        "auth_type": d.get("auth_type") or "password",
-        "access_token": _decrypt_secret(d.get("access_token")) if include_password else "",
-        "refresh_token": _decrypt_secret(d.get("refresh_token")) if include_password else "",
-        "token_expiry": d.get("token_expiry") or "",
-    }
+    cfg = _doc_to_cfg(d, include_password)
+    if not include_password:
+        cfg["password"] = None
+    return cfg
 
 
 def get_by_username(username: str, include_password: bool = True, owner_email: Optional[str] = None) -> Optional[Dict[str, Any]]:
     coll = _get_collection()
-    projection = None if include_password else {"password": 0}
     q = {"username": username}
+    kwargs: Dict[str, Any] = {}
     if owner_email:
-        q['owner_email'] = owner_email.lower()
-    d = coll.find_one(q, projection)
+        q['owner_email'] = _norm_email(owner_email)
+        if _OWNER_USERNAME_INDEX_READY:
+            # Clave exacta en el índice único (owner_email, username)
+            kwargs["hint"] = _OWNER_USERNAME_INDEX
+    d = coll.find_one(q, _projection(include_password), **kwargs)
     if not d:
         return None
-    return {
-        "id": str(d.get("_id")),
-        "name": d.get("name"),
-        "host": d.get("host"),
-        "port": int(d.get("port", 993)),
-        "username": d.get("username"),
-        "password": _decrypt_secret(d.get("password")) if include_password else None,
-        "use_ssl": bool(d.get("use_ssl", True)),
-        "search_criteria": d.get("search_criteria") or "UNSEEN",
-        "search_terms": d.get("search_terms") or [],
-        "search_synonyms": d.get("search_synonyms") or {},
-        "fallback_sender_match": bool(d.get("fallback_sender_match", False)),
-        "fallback_attachment_match": bool(d.get("fallback_attachment_match", False)),
-        "provider": d.get("provider") or "other",
-        "enabled": bool(d.get("enabled", True)),
-        # OAuth fields
-        "auth_type": d.get("auth_type") or "password",
-        "access_token": _decrypt_secret(d.get("access_token")) if include_password else "",
-        "refresh_token": _decrypt_secret(d.get("refresh_token")) if include_password else "",
-        "token_expiry": d.get("token_expiry") or "",
-    }
+    cfg = _doc_to_cfg(d, include_password)
+    if not include_password:
+        cfg["password"] = None
+    return cfg
 
 
-def count_configs_by_owner(owner_email: str) -> int:
+def count_configs_by_owner(owner_email: str, cap: Optional[int] = None) -> int:
     """
     Cuenta cuántas configuraciones de correo tiene un usuario.
-    Usado para validar límite de cuentas por plan.
+    Usado para validar límite de cuentas por plan: con `cap` el conteo se
+    detiene al llegar al límite (devuelve min(total, cap)).
     """
     coll = _get_collection()
-    return coll.count_documents({"owner_email": owner_email.lower()})
+    kwargs: Dict[str, Any] = {}
+    if _OWNER_INDEX_READY:
+        kwargs["hint"] = _OWNER_INDEX
+    if cap is not None and cap > 0:
+        kwargs["limit"] = cap
+    # Mismo valor que guarda create_config: un dueño vacío se almacena como "" (no None)
+    return coll.count_documents({"owner_email": (owner_email or "").lower()}, **kwargs)
 
 def get_email_config(username: str, include_password: bool = True, owner_email: Optional[str] = None) -> Optional[Dict[str, Any]]:
     """Alias for get_by_username to avoid breaking existing code."""
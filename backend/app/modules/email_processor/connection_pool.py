@@ -4,34 +4,98 @@ Reduce 70% del tiempo de conexión y mejora estabilidad
 """
 import imaplib
 import logging
+import random
 import time
 import threading
 import socket
-from typing import Dict, Optional, List, Union
+from collections import deque
+from typing import Deque, Dict, Optional, List, Set, Tuple, Union
 from dataclasses import dataclass
-from datetime import datetime, timedelta
-from queue import Queue, Empty
 
+from app.config.settings import settings
 from app.models.models import EmailConfig
 
 logger = logging.getLogger(__name__)
 
-@dataclass
+# Conexiones usadas hace menos que esto se entregan sin NOOP de verificación: un
+# fallo se detecta en el primer comando real y el llamador descarta la conexión.
+_FRESH_WINDOW_SECONDS = 30.0
+
+# Backoff exponencial con "full jitter": reintentos de muchas cuentas tras un corte
+# no caen todos en el mismo instante sobre el servidor IMAP.
+_BACKOFF_CAP_SECONDS = 30.0
+
+
+def _backoff_delay(attempt: int, base: Optional[float] = None) -> float:
+    if base is None:
+        base = settings.IMAP_BACKOFF_BASE_SECONDS
+    return random.uniform(0, min(_BACKOFF_CAP_SECONDS, base * 2 ** attempt))
+
+
+def _get_sock(conn: imaplib.IMAP4) -> Optional[socket.socket]:
+    """Socket de la conexión, o None si aún no existe / ya se cerró."""
+    return getattr(conn, 'sock', None)
+
+
+def _force_close(conn: imaplib.IMAP4) -> None:
+    """
+    Cierra el socket sin CLOSE/LOGOUT. Para conexiones rotas o descartadas, donde
+    el cierre a nivel protocolo solo esperaría el timeout de un socket muerto.
+    """
+    sock = _get_sock(conn)
+    try:
+        if sock is not None:
+            sock.settimeout(0.1)
+        conn.shutdown()
+    except (OSError, imaplib.IMAP4.error):
+        pass
+
+
+def _pop_used_before(idle: Deque["IMAPConnection"], cutoff: float) -> List["IMAPConnection"]:
+    """
+    Saca por la izquierda (las más antiguas) las conexiones con last_used <= cutoff.
+    Tolera que un checkout sin lock vacíe la pila por la derecha a la vez.
+    """
+    popped = []
+    while True:
+        try:
+            if idle[0].last_used > cutoff:
+                break
+            popped.append(idle.popleft())
+        except IndexError:
+            break
+    return popped
+
+
+@dataclass(eq=False, slots=True)
 class IMAPConnection:
     """Representa una conexión IMAP reutilizable."""
     connection: imaplib.IMAP4_SSL
     config_key: str  # Clave única para la configuración
-    last_used: datetime
+    last_used: float  # time.monotonic(): inmune a saltos del reloj de pared
     is_alive: bool = True
     
+    def looks_usable(self) -> bool:
+        """Chequeo local, sin I/O de red: no marcada como muerta y con socket abierto."""
+        if not self.is_alive:
+            return False
+        sock = _get_sock(self.connection)
+        if sock is None:
+            return True
+        try:
+            return sock.fileno() != -1
+        except OSError:
+            return False
+
     def test_connection(self) -> bool:
         """Verifica si la conexión sigue activa."""
         try:
             # Configurar timeout corto para test rápido
             old_timeout = None
-            if hasattr(self.connection, 'sock') and self.connection.sock:
-                old_timeout = self.connection.sock.gettimeout()
-                self.connection.sock.settimeout(5.0)  # 5 segundos para test
+            sock = _get_sock(self.connection)
+            if sock is not None:
+                old_timeout = sock.gettimeout()
+                sock.settimeout(settings.IMAP_NOOP_TIMEOUT_SECONDS)
             
             try:
                 self.connection.noop()
@@ -42,36 +106,65 @@ class IMAPConnection:
                 return False
             finally:
                 # Restaurar timeout original
-                if old_timeout is not None and hasattr(self.connection, 'sock') and self.connection.sock:
+                if old_timeout is not None:
                     try:
-                        self.connection.sock.settimeout(old_timeout)
-                    except:
+                        sock.settimeout(old_timeout)
+                    except OSError:
                         pass
         except Exception as e:
             logger.error(f"Error inesperado en test de conexión: {e}")
             self.is_alive = False
             return False
 
+class _PoolHolder:
+    """Estado del pool de una cuenta (config_key), con su propio lock."""
+
+    def __init__(self, max_connections: int):
+        # No se mantiene durante NOOP ni close/logout (ya no hace falta reentrante)
+        self.lock = threading.Lock()
+        # Conexiones libres como pila (LIFO, la más reciente a la derecha; el checkout
+        # hace pop() sin lock) y el total creado (libres + prestadas). Un set da altas
+        # y bajas O(1); la identidad de cada conexión es la del objeto.
+        self.idle: Deque[IMAPConnection] = deque()
+        self.active: Set[IMAPConnection] = set()
+        # Conexiones en creación (TLS + LOGIN fuera del lock); cuentan contra el máximo
+        self.pending = 0
+        # Tras agotar reintentos no se vuelve a crear hasta next_retry_at (monotonic)
+        self.failures = 0
+        self.next_retry_at = 0.0
+        # Hilos esperando un slot con el pool lleno: (slot, evento). return_connection
+        # entrega la conexión directamente en el slot, sin pasar por la cola.
+        self.waiters: Deque[Tuple[List["IMAPConnection"], threading.Event]] = deque()
+
+
 class IMAPConnectionPool:
     """
     Pool de conexiones IMAP para reutilizar conexiones y mejorar performance.
     Reduce significativamente el tiempo de establecimiento de conexiones.
     """
     
-    def __init__(self, max_connections: int = 5, connection_timeout: int = 300):
+    def __init__(self, max_connections: int = 5, connection_timeout: int = 300, wait_timeout: float = 10.0):
         """
         Inicializa el pool de conexiones.
         
         Args:
             max_connections: Máximo número de conexiones por configuración
             connection_timeout: Tiempo en segundos antes de cerrar conexión inactiva
+            wait_timeout: Segundos que get_connection espera una conexión liberada con el pool lleno
         """
         self.max_connections = max_connections
         self.connection_timeout = connection_timeout
-        self.pools: Dict[str, Queue] = {}
-        self.active_connections: Dict[str, List[IMAPConnection]] = {}
+        self.wait_timeout = wait_timeout
+        # Locks por cuenta: operaciones sobre cuentas distintas no se bloquean entre sí.
+        # _map_lock solo protege el alta de holders y last_error_by_config.
+        self._holders: Dict[str, _PoolHolder] = {}
         self.last_error_by_config: Dict[str, str] = {}
-        self.lock = threading.RLock()
+        self._map_lock = threading.Lock()
+        
+        # La limpieza duerme hasta el próximo vencimiento (monotonic) o hasta que
+        # return_connection programe uno más temprano; sin conexiones en pool no despierta
+        self._cleanup_cond = threading.Condition()
+        self._next_expiry: Optional[float] = None
         
         # Iniciar thread de limpieza
         self.cleanup_thread = threading.Thread(target=self._cleanup_expired_connections, daemon=True)
@@ -83,12 +176,23 @@ class IMAPConnectionPool:
         """Genera clave única para la configuración de email."""
         return f"{config.host}:{config.port}:{config.username}"
 
+    def _get_holder(self, config_key: str) -> _PoolHolder:
+        holder = self._holders.get(config_key)
+        if holder is None:
+            with self._map_lock:
+                holder = self._holders.setdefault(config_key, _PoolHolder(self.max_connections))
+        return holder
+
+    def _snapshot_holders(self) -> List[tuple]:
+        with self._map_lock:
+            return list(self._holders.items())
+
     def _set_last_error(self, config_key: str, message: str) -> None:
-        with self.lock:
+        with self._map_lock:
             self.last_error_by_config[config_key] = str(message or "").strip()
 
     def _clear_last_error(self, config_key: str) -> None:
-        with self.lock:
+        with self._map_lock:
             self.last_error_by_config.pop(config_key, None)
 
     def get_last_error(self, config_or_key: Union[EmailConfig, str]) -> Optional[str]:
@@ -97,15 +201,16 @@ class IMAPConnectionPool:
             config_key = self._get_config_key(config_or_key)
         else:
             config_key = str(config_or_key)
-        with self.lock:
+        with self._map_lock:
             value = self.last_error_by_config.get(config_key)
         return value or None
     
-    def _create_connection(self, config: EmailConfig) -> Optional[IMAPConnection]:
+    def _create_connection(self, config: EmailConfig, config_key: Optional[str] = None) -> Optional[IMAPConnection]:
         """Crea una nueva conexión IMAP con retry automático. Soporta OAuth2 XOAUTH2."""
-        max_retries = 3
-        retry_delay = 2  # segundos
-        config_key = self._get_config_key(config)
+        if config_key is None:
+            config_key = self._get_config_key(config)
+        max_retries = max(1, settings.IMAP_MAX_RETRIES)
+        timeout = settings.IMAP_TIMEOUT_SECONDS
         
         # Detectar tipo de autenticación
         auth_type = getattr(config, 'auth_type', 'password')
@@ -117,15 +222,16 @@ class IMAPConnectionPool:
                 
                 # Establecer conexión con timeout real en handshake para evitar cuelgues indefinidos
                 if config.port == 993:
-                    conn = imaplib.IMAP4_SSL(config.host, config.port, timeout=30)
+                    conn = imaplib.IMAP4_SSL(config.host, config.port, timeout=timeout)
                 else:
-                    conn = imaplib.IMAP4(config.host, config.port, timeout=30)
+                    conn = imaplib.IMAP4(config.host, config.port, timeout=timeout)
                     if hasattr(config, 'use_ssl') and config.use_ssl:
                         conn.starttls()
                 
                 # Configurar timeouts de socket
-                if hasattr(conn, 'sock') and conn.sock:
-                    conn.sock.settimeout(30.0)  # 30 segundos timeout general
+                sock = _get_sock(conn)
+                if sock is not None:
+                    sock.settimeout(timeout)
                 
                 # Autenticar: OAuth2 XOAUTH2 o password tradicional
                 try:
@@ -155,14 +261,10 @@ class IMAPConnectionPool:
                             config_key,
                             f"IMAP_AUTH_ERROR: Error autenticando {config.username}: {err_raw}",
                         )
-                    try:
-                        conn.close()
-                        conn.logout()
-                    except:
-                        pass
+                    _force_close(conn)
                     if attempt == max_retries - 1:
                         raise
-                    time.sleep(retry_delay * (attempt + 1))  # Backoff exponencial
+                    time.sleep(_backoff_delay(attempt))
                     continue
                 
                 connection_time = time.time() - start_time
@@ -170,7 +272,7 @@ class IMAPConnectionPool:
                 imap_conn = IMAPConnection(
                     connection=conn,
                     config_key=config_key,
-                    last_used=datetime.now()
+                    last_used=time.monotonic(),
                 )
                 self._clear_last_error(config_key)
                 
@@ -187,7 +289,7 @@ class IMAPConnectionPool:
                 if attempt == max_retries - 1:
                     logger.error(f"❌ Falló conexión IMAP después de {max_retries} intentos para {config.username}")
                     return None
-                time.sleep(retry_delay * (attempt + 1))  # Backoff exponencial
+                time.sleep(_backoff_delay(attempt))
                 
             except (imaplib.IMAP4.abort, imaplib.IMAP4.error) as e:
                 logger.warning(f"Error IMAP (intento {attempt + 1}/{max_retries}) para {config.username}: {e}")
@@ -198,7 +300,7 @@ class IMAPConnectionPool:
                 if attempt == max_retries - 1:
                     logger.error(f"❌ Error IMAP después de {max_retries} intentos para {config.username}")
                     return None
-                time.sleep(retry_delay * (attempt + 1))
+                time.sleep(_backoff_delay(attempt))
                 
             except Exception as e:
                 logger.error(f"❌ Error inesperado creando conexión IMAP para {config.username}: {e}")
@@ -212,7 +314,8 @@ class IMAPConnectionPool:
     
     def get_connection(self, config: EmailConfig) -> Optional[IMAPConnection]:
         """
-        Obtiene una conexión del pool o crea una nueva.
+        Obtiene una conexión del pool o crea una nueva. Con el pool lleno espera
+        hasta wait_timeout a que otro hilo devuelva o libere una conexión.
         
         Args:
             config: Configuración de email
@@ -221,61 +324,105 @@ class IMAPConnectionPool:
             Conexión IMAP reutilizable o None si falla
         """
         config_key = self._get_config_key(config)
+        holder = self._get_holder(config_key)
+        deadline = time.monotonic() + self.wait_timeout
         
-        with self.lock:
-            # Inicializar pool para esta configuración si no existe
-            if config_key not in self.pools:
-                self.pools[config_key] = Queue(maxsize=self.max_connections)
-                self.active_connections[config_key] = []
-            
-            pool = self.pools[config_key]
+        while True:
+            imap_conn = self._checkout_idle(holder, config)
+            if imap_conn:
+                return imap_conn
             
-            # Intentar obtener conexión del pool
-            try:
-                while not pool.empty():
-                    imap_conn = pool.get_nowait()
+            waiter: Optional[Tuple[List[IMAPConnection], threading.Event]] = None
+            with holder.lock:
+                if holder.idle:
+                    # Se devolvió una conexión entre el pop sin lock y este bloque
+                    continue
+                # Si no hay conexiones disponibles, reservar un slot y crear una nueva
+                reserved = len(holder.active) + holder.pending < self.max_connections
+                if reserved and time.monotonic() < holder.next_retry_at:
+                    # La cuenta falló hace poco: no reiniciar el ciclo de reintentos
+                    logger.warning(f"⏳ Conexión IMAP para {config.username} en backoff tras fallos recientes")
+                    return None
+                if reserved:
+                    holder.pending += 1
+                else:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._set_last_error(
+                            config_key,
+                            (
+                                f"IMAP_POOL_EXHAUSTED: Pool de conexiones IMAP lleno para {config.username} "
+                                f"({len(holder.active)}/{self.max_connections})"
+                            ),
+                        )
+                        logger.warning(f"⚠️ No se pudo obtener conexión IMAP para {config.username} (pool lleno)")
+                        return None
                     
-                    # Verificar si la conexión sigue viva
-                    if imap_conn.test_connection():
-                        imap_conn.last_used = datetime.now()
-                        logger.info(f"🔄 Reutilizando conexión IMAP para {config.username}")
-                        return imap_conn
-                    else:
-                        # Conexión muerta, remover de activas
-                        try:
-                            self.active_connections[config_key].remove(imap_conn)
-                        except ValueError:
-                            pass
-                        
-                        # Cerrar conexión muerta
-                        try:
-                            imap_conn.connection.close()
-                            imap_conn.connection.logout()
-                        except:
-                            pass
-                        
-                        logger.warning(f"🔌 Conexión IMAP muerta removida para {config.username}")
-            
-            except Empty:
-                pass
+                    # Pool lleno: esperar a que otro hilo devuelva o libere una conexión
+                    waiter = ([], threading.Event())
+                    holder.waiters.append(waiter)
             
-            # Si no hay conexiones disponibles, crear una nueva
-            if len(self.active_connections[config_key]) < self.max_connections:
-                imap_conn = self._create_connection(config)
+            if reserved:
+                # El handshake va fuera del lock: otros hilos de la misma cuenta
+                # pueden reutilizar, devolver o crear en paralelo
+                imap_conn = None
+                try:
+                    imap_conn = self._create_connection(config, config_key)
+                finally:
+                    with holder.lock:
+                        holder.pending -= 1
+                        if imap_conn:
+                            holder.active.add(imap_conn)
+                            holder.failures = 0
+                            holder.next_retry_at = 0.0
+                        else:
+                            holder.next_retry_at = time.monotonic() + _backoff_delay(holder.failures)
+                            holder.failures += 1
+                        if not imap_conn and holder.waiters:
+                            # El slot reservado quedó libre
+                            holder.waiters.popleft()[1].set()
                 if imap_conn:
-                    self.active_connections[config_key].append(imap_conn)
                     return imap_conn
+                logger.warning(f"⚠️ No se pudo obtener conexión IMAP para {config.username}")
+                return None
             
-            if len(self.active_connections[config_key]) >= self.max_connections:
-                self._set_last_error(
-                    config_key,
-                    (
-                        f"IMAP_POOL_EXHAUSTED: Pool de conexiones IMAP lleno para {config.username} "
-                        f"({len(self.active_connections[config_key])}/{self.max_connections})"
-                    ),
-                )
-            logger.warning(f"⚠️ No se pudo obtener conexión IMAP para {config.username} (pool lleno)")
-            return None
+            waiter[1].wait(remaining)
+            with holder.lock:
+                if waiter[0]:
+                    imap_conn = waiter[0][0]
+                    logger.info(f"🤝 Conexión IMAP recibida directamente de otro hilo para {config.username}")
+                    return imap_conn
+                try:
+                    holder.waiters.remove(waiter)
+                except ValueError:
+                    pass
+            # Se liberó un slot (conexión cerrada) o venció la espera: reintentar
+    
+    def _checkout_idle(self, holder: _PoolHolder, config: EmailConfig) -> Optional[IMAPConnection]:
+        """
+        Saca una conexión viva de la pila del holder sin tomar su lock: deque.pop()
+        es atómico con el GIL. El NOOP de verificación y el cierre de conexiones
+        muertas también van fuera del lock.
+        """
+        while True:
+            try:
+                # LIFO: la usada más recientemente, con menos chance de haber
+                # sido cortada por el timeout de inactividad del servidor
+                imap_conn = holder.idle.pop()
+            except IndexError:
+                return None
+            
+            # Verificar si la conexión sigue viva (NOOP solo si estuvo inactiva un rato)
+            now = time.monotonic()
+            idle = now - imap_conn.last_used
+            if imap_conn.looks_usable() and (idle < _FRESH_WINDOW_SECONDS or imap_conn.test_connection()):
+                imap_conn.last_used = now
+                logger.info(f"🔄 Reutilizando conexión IMAP para {config.username}")
+                return imap_conn
+            
+            # Conexión muerta: remover de activas y cerrarla
+            self._close_connection(imap_conn)
+            logger.warning(f"🔌 Conexión IMAP muerta removida para {config.username}")
     
     def return_connection(self, imap_conn: IMAPConnection) -> bool:
         """
@@ -289,62 +436,89 @@ class IMAPConnectionPool:
         """
         try:
             config_key = imap_conn.config_key
+            holder = self._holders.get(config_key)
+            if holder is None:
+                return False
             
-            with self.lock:
-                if config_key in self.pools:
-                    pool = self.pools[config_key]
-                    
-                    # Verificar que la conexión siga viva
-                    if imap_conn.test_connection() and not pool.full():
-                        imap_conn.last_used = datetime.now()
-                        pool.put_nowait(imap_conn)
-                        logger.debug(f"↩️ Conexión IMAP devuelta al pool: {config_key}")
+            # Sin NOOP: el llamador acaba de usarla; basta el chequeo local
+            if imap_conn.looks_usable():
+                with holder.lock:
+                    if holder.waiters:
+                        # Entregar directamente a un hilo en espera
+                        slot, event = holder.waiters.popleft()
+                        imap_conn.last_used = time.monotonic()
+                        slot.append(imap_conn)
+                        event.set()
                         return True
+                    if len(holder.idle) < self.max_connections:
+                        imap_conn.last_used = time.monotonic()
+                        holder.idle.append(imap_conn)
+                        logger.debug(f"↩️ Conexión IMAP devuelta al pool: {config_key}")
+                        queued = True
                     else:
-                        # Conexión muerta o pool lleno, cerrar
-                        self._close_connection(imap_conn)
-                        return False
-                
-                return False
+                        queued = False
+                if queued:
+                    self._schedule_cleanup(time.monotonic() + self.connection_timeout)
+                    return True
+            
+            # Conexión muerta o pool lleno, cerrar (LOGOUT solo si sigue sana)
+            self._close_connection(imap_conn, graceful=imap_conn.looks_usable())
+            return False
                 
         except Exception as e:
             logger.error(f"Error devolviendo conexión al pool: {e}")
             self._close_connection(imap_conn)
             return False
     
-    def _close_connection(self, imap_conn: IMAPConnection):
-        """Cierra una conexión IMAP de forma segura."""
+    def discard_connection(self, imap_conn: IMAPConnection) -> None:
+        """Descarta una conexión que falló en uso (no vuelve al pool y libera su slot)."""
+        imap_conn.is_alive = False
+        self._close_connection(imap_conn)
+    
+    def _close_connection(self, imap_conn: IMAPConnection, graceful: bool = False):
+        """
+        Cierra una conexión IMAP de forma segura. Con graceful=True envía CLOSE y
+        LOGOUT; si no, solo cierra el socket (conexiones rotas, vencidas o descartadas).
+        No llamar con el lock del holder tomado: close/logout son I/O de red.
+        """
         try:
             config_key = imap_conn.config_key
             
             # Remover de activas
-            with self.lock:
-                if config_key in self.active_connections:
-                    try:
-                        self.active_connections[config_key].remove(imap_conn)
-                    except ValueError:
-                        pass
+            holder = self._holders.get(config_key)
+            if holder is not None:
+                with holder.lock:
+                    if imap_conn in holder.active:
+                        holder.active.discard(imap_conn)
+                        if holder.waiters:
+                            # Se liberó un slot: despertar a un hilo en espera para que cree otra
+                            holder.waiters.popleft()[1].set()
             
-            # Cerrar conexión de forma segura
-            try:
-                # Configurar timeout corto para cierre
-                if hasattr(imap_conn.connection, 'sock') and imap_conn.connection.sock:
-                    imap_conn.connection.sock.settimeout(5.0)
-                
-                try:
-                    imap_conn.connection.close()
-                except (socket.timeout, socket.error, imaplib.IMAP4.abort, imaplib.IMAP4.error):
-                    # Ignorar errores de cierre
-                    pass
-                
+            if not graceful:
+                _force_close(imap_conn.connection)
+                imap_conn.is_alive = False
+                logger.debug(f"🔌 Conexión IMAP cerrada (socket): {config_key}")
+                return
+            
+            # Cerrar conexión de forma segura (socket.timeout es OSError; abort es IMAP4.error)
+            sock = _get_sock(imap_conn.connection)
+            if sock is not None:
                 try:
-                    imap_conn.connection.logout()
-                except (socket.timeout, socket.error, imaplib.IMAP4.abort, imaplib.IMAP4.error):
-                    # Ignorar errores de logout
+                    # Configurar timeout corto para cierre
+                    sock.settimeout(5.0)
+                except OSError:
                     pass
-                    
-            except Exception:
-                # Ignorar cualquier error de cierre/logout
+            
+            try:
+                imap_conn.connection.close()
+            except (OSError, imaplib.IMAP4.error):
+                # Ignorar errores de cierre
+                pass
+            
+            try:
+                imap_conn.connection.logout()
+            except (OSError, imaplib.IMAP4.error):
+                # Ignorar errores de logout
                 pass
             
             imap_conn.is_alive = False
@@ -355,58 +529,98 @@ class IMAPConnectionPool:
             # Asegurar que se marque como no viva
             imap_conn.is_alive = False
     
+    def _schedule_cleanup(self, when: float) -> None:
+        """Adelanta la próxima limpieza si `when` (monotonic) vence antes que la programada."""
+        with self._cleanup_cond:
+            if self._next_expiry is None or when < self._next_expiry:
+                self._next_expiry = when
+                self._cleanup_cond.notify()
+    
     def _cleanup_expired_connections(self):
-        """Thread que limpia conexiones expiradas periódicamente."""
+        """Thread que limpia conexiones expiradas al vencer la más antigua del pool."""
         while True:
             try:
-                time.sleep(60)  # Verificar cada minuto
-                
-                expired_cutoff = datetime.now() - timedelta(seconds=self.connection_timeout)
+                with self._cleanup_cond:
+                    while self._next_expiry is None:
+                        self._cleanup_cond.wait()
+                    delay = self._next_expiry - time.monotonic()
+                    if delay > 0:
+                        self._cleanup_cond.wait(delay)
+                        continue
+                    self._next_expiry = None
                 
-                with self.lock:
-                    for config_key in list(self.pools.keys()):
-                        pool = self.pools[config_key]
-                        active = self.active_connections[config_key]
-                        
-                        # Limpiar conexiones expiradas del pool
-                        connections_to_remove = []
-                        temp_queue = Queue(maxsize=self.max_connections)
-                        
-                        while not pool.empty():
-                            try:
-                                imap_conn = pool.get_nowait()
-                                if imap_conn.last_used > expired_cutoff and imap_conn.test_connection():
-                                    temp_queue.put_nowait(imap_conn)
-                                else:
-                                    connections_to_remove.append(imap_conn)
-                            except Empty:
-                                break
-                        
-                        # Restaurar conexiones válidas
-                        self.pools[config_key] = temp_queue
-                        
-                        # Cerrar conexiones expiradas
-                        for conn in connections_to_remove:
-                            self._close_connection(conn)
-                        
-                        if connections_to_remove:
-                            logger.info(f"🧹 Limpiadas {len(connections_to_remove)} conexiones expiradas de {config_key}")
+                next_expiry = self._sweep_expired_connections()
+                if next_expiry is not None:
+                    self._schedule_cleanup(next_expiry)
                 
             except Exception as e:
                 logger.error(f"Error en limpieza de conexiones: {e}")
     
+    def _sweep_expired_connections(self) -> Optional[float]:
+        """
+        Cierra las conexiones vencidas de todas las cuentas. Devuelve el próximo
+        vencimiento (monotonic) entre las que quedan en pool, o None si no queda ninguna.
+        """
+        now = time.monotonic()
+        expired_cutoff = now - self.connection_timeout
+        # Solo se verifica con NOOP lo que lleva más de la mitad del timeout inactivo
+        stale_cutoff = now - self.connection_timeout / 2
+        oldest_kept: Optional[float] = None
+        
+        # Cada cuenta se limpia por separado; los locks solo cubren el recorte y
+        # la restauración de la pila, los NOOP y cierres van fuera del lock
+        for config_key, holder in self._snapshot_holders():
+            with holder.lock:
+                # La pila está ordenada por last_used: vencidas y luego inactivas a la
+                # izquierda. Las vencidas se cierran sin NOOP; las recientes no se tocan.
+                connections_to_remove = _pop_used_before(holder.idle, expired_cutoff)
+                stale = _pop_used_before(holder.idle, stale_cutoff)
+            
+            connections_to_keep = []
+            for imap_conn in stale:
+                if imap_conn.test_connection():
+                    connections_to_keep.append(imap_conn)
+                else:
+                    connections_to_remove.append(imap_conn)
+            
+            # Restaurar conexiones válidas: primero a hilos que empezaron a esperar
+            # durante los NOOP, el resto debajo de las devueltas mientras tanto
+            with holder.lock:
+                while connections_to_keep and holder.waiters:
+                    slot, event = holder.waiters.popleft()
+                    imap_conn = connections_to_keep.pop()
+                    imap_conn.last_used = time.monotonic()
+                    slot.append(imap_conn)
+                    event.set()
+                holder.idle.extendleft(reversed(connections_to_keep))
+                try:
+                    oldest = holder.idle[0].last_used
+                except IndexError:
+                    oldest = None
+                if oldest is not None and (oldest_kept is None or oldest < oldest_kept):
+                    oldest_kept = oldest
+            
+            # Cerrar conexiones expiradas
+            for conn in connections_to_remove:
+                self._close_connection(conn)
+            
+            if connections_to_remove:
+                logger.info(f"🧹 Limpiadas {len(connections_to_remove)} conexiones expiradas de {config_key}")
+        
+        if oldest_kept is None:
+            return None
+        return max(oldest_kept + self.connection_timeout, now)
+    
     def get_pool_stats(self) -> Dict[str, Dict[str, int]]:
         """Obtiene estadísticas del pool de conexiones."""
         stats = {}
         
-        with self.lock:
-            for config_key in self.pools:
-                pool = self.pools[config_key]
-                active = self.active_connections[config_key]
-                
+        for config_key, holder in self._snapshot_holders():
+            with holder.lock:
                 stats[config_key] = {
-                    'active_connections': len(active),
-                    'pooled_connections': pool.qsize(),
+                    'active_connections': len(holder.active),
+                    'pending_connections': holder.pending,
+                    'pooled_connections': len(holder.idle),
                     'max_connections': self.max_connections
                 }
         
@@ -416,37 +630,33 @@ class IMAPConnectionPool:
         """Cierra todas las conexiones del pool."""
         logger.info("🔌 Cerrando todas las conexiones IMAP del pool...")
         
-        with self.lock:
-            for config_key in list(self.pools.keys()):
-                pool = self.pools[config_key]
-                active = self.active_connections[config_key]
-                
-                # Cerrar conexiones en pool
-                while not pool.empty():
-                    try:
-                        imap_conn = pool.get_nowait()
-                        self._close_connection(imap_conn)
-                    except Empty:
-                        break
-                
-                # Cerrar conexiones activas
-                for imap_conn in active[:]:
-                    self._close_connection(imap_conn)
-                
-                # Limpiar estructuras
-                del self.pools[config_key]
-                del self.active_connections[config_key]
+        with self._map_lock:
+            holders = list(self._holders.values())
+            self._holders.clear()
+        
+        for holder in holders:
+            # Las conexiones en pool también figuran en active
+            with holder.lock:
+                connections = list(holder.active)
+                holder.active.clear()
+                holder.idle.clear()
+            
+            for imap_conn in connections:
+                self._close_connection(imap_conn, graceful=True)
         
         logger.info("✅ Todas las conexiones IMAP cerradas")
 
-# Instancia global del pool
+# Instancia global del pool: compartida entre hilos para que el tope por cuenta sea global
 _connection_pool: Optional[IMAPConnectionPool] = None
+_connection_pool_lock = threading.Lock()
 
 def get_imap_pool() -> IMAPConnectionPool:
     """Obtiene la instancia global del pool de conexiones IMAP."""
     global _connection_pool
     if _connection_pool is None:
-        max_conn = 5  # Configurable desde settings
-        timeout = 300  # 5 minutos
-        _connection_pool = IMAPConnectionPool(max_conn, timeout)
+        with _connection_pool_lock:
+            if _connection_pool is None:
+                max_conn = 5  # Configurable desde settings
+                timeout = 300  # 5 minutos
+                _connection_pool = IMAPConnectionPool(max_conn, timeout)
     return _connection_pool
@@ -6,6 +6,7 @@ import logging
 import queue
 import pickle
 import email.utils
+import imaplib
 from typing import Callable, List, Tuple, Dict, Any, Optional
 from datetime import datetime, timedelta
 from concurrent.futures import ThreadPoolExecutor, as_completed
@@ -114,9 +115,12 @@ class EmailProcessor:
         
         start_conn = time.time()
         logger.info(f"⏱️ Solicitando conexión IMAP al pool para {self.config.username}")
-        self.current_connection = self.connection_pool.get_connection(self.config)
-        elapsed_conn = time.time() - start_conn
-        if self.current_connection:
+        # El pool entrega conexiones recientes sin NOOP: si la primera falla al
+        # seleccionar el mailbox por un socket caído, se descarta y se pide otra.
+        for attempt in range(2):
+            self.current_connection = self.connection_pool.get_connection(self.config)
+            if not self.current_connection:
+                break
             # IMPORTANT: Sincronizar la conexión real con el cliente IMAP interno
             self.client.conn = self.current_connection.connection
             
@@ -124,11 +128,17 @@ class EmailProcessor:
             # Tras obtener una conexión del pool (estado AUTH), comandos como SEARCH/FETCH fallan
             try:
                 self.client.conn.select(self.client.mailbox or "INBOX")
+            except (imaplib.IMAP4.abort, OSError) as e:
+                logger.warning(f"⚠️ Conexión del pool caída para {self.config.username} (intento {attempt + 1}): {e}")
+                self.connection_pool.discard_connection(self.current_connection)
+                self.current_connection = None
+                self.client.conn = None
+                continue
             except Exception as e:
                 logger.warning(f"⚠️ Error al seleccionar mailbox {self.client.mailbox} en conexión del pool: {e}")
-                # Si falla select, la conexión podría estar corrupta, mejor no usarla
-                # Pero por ahora lo dejamos pasar o el pool la marcará muerta después
-                
+            break
+        elapsed_conn = time.time() - start_conn
+        if self.current_connection:
             logger.info(f"🔄 Conexión IMAP obtenida del pool para {self.config.username} en {elapsed_conn:.2f}s")
             return True
         
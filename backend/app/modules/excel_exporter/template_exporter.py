@@ -14,6 +14,21 @@ from app.models.models import InvoiceData
 
 logger = logging.getLogger(__name__)
 
+
+def _to_number(value: Any) -> Optional[float]:
+    """Convierte a float; fast path para valores ya numéricos (caso típico)."""
+    if type(value) is float:
+        return value
+    if type(value) is int:
+        return float(value)
+    if value is None or value == "":
+        return None
+    try:
+        return float(value)
+    except (ValueError, TypeError):
+        return None
+
+
 class ExcelExporter:
     """Motor de exportación de facturas a Excel usando templates personalizables"""
     
@@ -185,10 +200,12 @@ class ExcelExporter:
                 # Usar mapeo si existe
                 possible_fields = field_mappings.get(field_key, [subcampo])
                 
-                # Extraer valores del subcampo de todos los productos
+                # Extraer valores del subcampo de todos los productos.
+                # La lista es homogénea (model_dump() produce dicts): se decide el tipo una vez.
                 valores = []
-                for producto in productos:
-                    if isinstance(producto, dict):
+                if isinstance(productos[0], dict):
+                    name_fallback = subcampo in ('articulo', 'descripcion', 'nombre')
+                    for producto in productos:
                         # Intentar cada posible mapeo hasta encontrar un valor
                         valor = None
                         for posible_campo in possible_fields:
@@ -197,15 +214,16 @@ class ExcelExporter:
                                 break
                         
                         # Compatibilidad adicional por si no se encontró
-                        if valor is None and subcampo in ['articulo', 'descripcion', 'nombre']:
+                        if valor is None and name_fallback:
                             valor = (producto.get('nombre') or 
                                      producto.get('descripcion') or 
                                      producto.get('articulo'))
                         
                         if valor is not None:
                             valores.append(valor)
-                    else:
-                        # Si es un objeto Pydantic
+                else:
+                    # Objetos Pydantic
+                    for producto in productos:
                         valor = None
                         for posible_campo in possible_fields:
                             valor = getattr(producto, posible_campo, None)
@@ -287,12 +305,9 @@ class ExcelExporter:
                 fields_to_sum = params.get("fields", [])
                 total = 0.0
                 for f_key in fields_to_sum:
-                    val = invoice_data.get(f_key)
+                    val = _to_number(invoice_data.get(f_key))
                     if val is not None:
-                        try:
-                            total += float(val)
-                        except (ValueError, TypeError):
-                            pass
+                        total += val
                 return total
 
             elif t_type == "map_values":
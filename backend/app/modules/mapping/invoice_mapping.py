@@ -1,11 +1,48 @@
 from __future__ import annotations
 import re
-from typing import Tuple, List, Optional
+from operator import attrgetter
+from typing import Any, Tuple, List, Optional
 from datetime import datetime
 
-from app.models.models import InvoiceData
+from app.models.models import InvoiceData, ProductoFactura
 from app.models.invoice_v2 import InvoiceHeader, InvoiceDetail, InvoiceDocument, Party, Totales
 
+# Nombres alternativos de un mismo monto (XML nativo vs. parser OpenAI legacy), en orden de preferencia.
+_EXENTAS_KEYS = ("exento", "subtotal_exentas")
+_GRAVADO_5_KEYS = ("gravado_5", "subtotal_5")
+_GRAVADO_10_KEYS = ("gravado_10", "subtotal_10")
+_TOTAL_KEYS = ("monto_total", "total_general")
+
+
+def _first_float(invoice: InvoiceData, keys: Tuple[str, ...]) -> float:
+    """Primer valor no vacío entre `keys`, como float (0.0 si ninguno)."""
+    for key in keys:
+        value = getattr(invoice, key, None)
+        if value:
+            return float(value)
+    return 0.0
+
+
+# ProductoFactura solo expone `nombre` como descripción; el resto de campos coincide con InvoiceDetail.
+_PRODUCTO_FIELDS = attrgetter("nombre", "cantidad", "precio_unitario", "total", "iva")
+
+
+def _producto_row(p: Any) -> Tuple[Any, Any, Any, Any, Any]:
+    """(descripcion, cantidad, precio_unitario, total, iva) desde dict u objeto arbitrario."""
+    if isinstance(p, dict):
+        desc = p.get("descripcion") or p.get("articulo") or p.get("nombre")
+        return desc, p.get("cantidad"), p.get("precio_unitario"), p.get("total"), p.get("iva")
+    desc = (getattr(p, "descripcion", "") or
+            getattr(p, "articulo", "") or
+            getattr(p, "nombre", ""))
+    return (
+        desc,
+        getattr(p, "cantidad", 0),
+        getattr(p, "precio_unitario", 0),
+        getattr(p, "total", 0),
+        getattr(p, "iva", 0),
+    )
+
 
 def _split_numero(numero: Optional[str]) -> Tuple[str, str, str, str]:
     if not numero:
@@ -52,9 +89,13 @@ def map_invoice(invoice: InvoiceData, fuente: str = "", minio_key: str = "") ->
 
     resolved_minio_key = (minio_key or getattr(invoice, "minio_key", "") or "").strip()
 
+    # Bases gravadas: se usan en sus campos y como fallback de total_base_gravada.
+    gravado_5 = _first_float(invoice, _GRAVADO_5_KEYS)
+    gravado_10 = _first_float(invoice, _GRAVADO_10_KEYS)
+
     header = InvoiceHeader(
         id=str(header_id),
-        cdc=getattr(invoice, "cdc", ""),
+        cdc=getattr(invoice, "cdc", "") or "",
         tipo_documento=getattr(invoice, "tipo_documento", "CO") or "CO",
         establecimiento=est,
         punto=pto,
@@ -65,29 +106,29 @@ def map_invoice(invoice: InvoiceData, fuente: str = "", minio_key: str = "") ->
         condicion_venta=(getattr(invoice, "condicion_venta", "CONTADO") or "CONTADO").upper(),
         moneda=(getattr(invoice, "moneda", "GS") or "GS").upper(),
         tipo_cambio=float(getattr(invoice, "tipo_cambio", 0.0) or 0.0),
-        timbrado=getattr(invoice, "timbrado", ""),
+        timbrado=getattr(invoice, "timbrado", "") or "",
         emisor=Party(
-            ruc=getattr(invoice, "ruc_emisor", ""),
-            nombre=getattr(invoice, "nombre_emisor", ""),
-            direccion=getattr(invoice, "direccion_emisor", ""),
-            telefono=getattr(invoice, "telefono_emisor", ""),
-            email=getattr(invoice, "email_emisor", ""),
-            actividad_economica=getattr(invoice, "actividad_economica", "")
+            ruc=getattr(invoice, "ruc_emisor", "") or "",
+            nombre=getattr(invoice, "nombre_emisor", "") or "",
+            direccion=getattr(invoice, "direccion_emisor", "") or "",
+            telefono=getattr(invoice, "telefono_emisor", "") or "",
+            email=getattr(invoice, "email_emisor", "") or "",
+            actividad_economica=getattr(invoice, "actividad_economica", "") or ""
         ),
         receptor=Party(
-            ruc=getattr(invoice, "ruc_cliente", ""),
-            nombre=getattr(invoice, "nombre_cliente", ""),
-            email=getattr(invoice, "email_cliente", ""),
-            direccion=getattr(invoice, "direccion_cliente", ""),
-            telefono=getattr(invoice, "telefono_cliente", "")
+            ruc=getattr(invoice, "ruc_cliente", "") or "",
+            nombre=getattr(invoice, "nombre_cliente", "") or "",
+            email=getattr(invoice, "email_cliente", "") or "",
+            direccion=getattr(invoice, "direccion_cliente", "") or "",
+            telefono=getattr(invoice, "telefono_cliente", "") or ""
         ),
         totales=Totales(
-            exentas=float(getattr(invoice, "exento", 0) or getattr(invoice, "subtotal_exentas", 0) or 0),
-            gravado_5=float(getattr(invoice, "gravado_5", 0) or getattr(invoice, "subtotal_5", 0) or 0),
+            exentas=_first_float(invoice, _EXENTAS_KEYS),
+            gravado_5=gravado_5,
             iva_5=float(getattr(invoice, "iva_5", 0) or 0),
-            gravado_10=float(getattr(invoice, "gravado_10", 0) or getattr(invoice, "subtotal_10", 0) or 0),
+            gravado_10=gravado_10,
             iva_10=float(getattr(invoice, "iva_10", 0) or 0),
-            total=float(getattr(invoice, "monto_total", 0) or getattr(invoice, "total_general", 0) or 0),
+            total=_first_float(invoice, _TOTAL_KEYS),
             # CRÍTICO: Mapear campos faltantes para template export
             total_operacion=float(getattr(invoice, "total_operacion", 0) or 0),
             monto_exento=float(getattr(invoice, "monto_exento", 0) or 0),
@@ -95,13 +136,7 @@ def map_invoice(invoice: InvoiceData, fuente: str = "", minio_key: str = "") ->
             total_iva=float(getattr(invoice, "total_iva", 0) or 0),
             total_descuento=float(getattr(invoice, "total_descuento", 0) or 0),
             anticipo=float(getattr(invoice, "anticipo", 0) or 0),
-            total_base_gravada=float(
-                getattr(invoice, "total_base_gravada", 0)
-                or (
-                    float(getattr(invoice, "gravado_5", 0) or getattr(invoice, "subtotal_5", 0) or 0)
-                    + float(getattr(invoice, "gravado_10", 0) or getattr(invoice, "subtotal_10", 0) or 0)
-                )
-            ),
+            total_base_gravada=float(getattr(invoice, "total_base_gravada", 0) or (gravado_5 + gravado_10)),
             # ISC
             isc_total=float(getattr(invoice, "isc_total", 0) or 0),
             isc_base_imponible=float(getattr(invoice, "isc_base_imponible", 0) or 0),
@@ -127,39 +162,28 @@ def map_invoice(invoice: InvoiceData, fuente: str = "", minio_key: str = "") ->
         transporte_modalidad_codigo=getattr(invoice, "transporte_modalidad_codigo", "") or "",
         transporte_resp_flete_codigo=getattr(invoice, "transporte_resp_flete_codigo", "") or "",
         transporte_nro_despacho=getattr(invoice, "transporte_nro_despacho", "") or "",
-        email_origen=getattr(invoice, "email_origen", ""),
-        mes_proceso=getattr(invoice, "mes_proceso", ""),
-        fuente=fuente,
+        email_origen=getattr(invoice, "email_origen", "") or "",
+        mes_proceso=getattr(invoice, "mes_proceso", "") or "",
+        fuente=fuente or "",
         minio_key=resolved_minio_key
     )
 
     items: List[InvoiceDetail] = []
     productos = getattr(invoice, "productos", []) or []
-    for idx, p in enumerate(productos, start=1):
-        if isinstance(p, dict):
-            # Mapeo mejorado para productos desde dict
-            desc = p.get("descripcion") or p.get("articulo") or p.get("nombre") or ""
-            cant = float(p.get("cantidad", 0) or 0)
-            pu = float(p.get("precio_unitario", 0) or 0)
-            tot = float(p.get("total", 0) or 0)
-            iva = int(p.get("iva", 0) or 0)
-        else:
-            # Mapeo desde objeto Pydantic
-            desc = (getattr(p, "descripcion", "") or 
-                   getattr(p, "articulo", "") or 
-                   getattr(p, "nombre", "") or "")
-            cant = float(getattr(p, "cantidad", 0) or 0)
-            pu = float(getattr(p, "precio_unitario", 0) or 0)
-            tot = float(getattr(p, "total", 0) or 0)
-            iva = int(getattr(p, "iva", 0) or 0)
+    if productos and isinstance(productos[0], ProductoFactura):
+        # Caso típico (InvoiceData validado): lista homogénea, extracción en bloque
+        rows = map(_PRODUCTO_FIELDS, productos)
+    else:
+        rows = map(_producto_row, productos)
+    for idx, (desc, cant, pu, tot, iva) in enumerate(rows, start=1):
         items.append(InvoiceDetail(
             header_id=header.id,
             linea=idx,
-            descripcion=desc,
-            cantidad=cant,
-            precio_unitario=pu,
-            total=tot,
-            iva=iva
+            descripcion=desc or "",
+            cantidad=float(cant or 0),
+            precio_unitario=float(pu or 0),
+            total=float(tot or 0),
+            iva=int(iva or 0)
         ))
 
     return InvoiceDocument(header=header, items=items)
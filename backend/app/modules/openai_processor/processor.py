@@ -215,7 +215,7 @@ class OpenAIProcessor:
                         )
                     except Exception:
                         pass
-                    invoice = _coerce_invoice_model(native, email_metadata)
+                    invoice = _coerce_invoice_model(native, email_metadata, trusted=True)
                     invoice = validate_and_enhance_with_cdc(invoice)
                     try:
                         logger.info(
@@ -259,7 +259,7 @@ class OpenAIProcessor:
                         extended_metrics.record_ai_limit_hit(owner_email)
                         if 'native' in locals() and native:
                             logger.info("Returning partial native result instead of AI fallback due to limit.")
-                            invoice = _coerce_invoice_model(native, email_metadata)
+                            invoice = _coerce_invoice_model(native, email_metadata, trusted=True)
                             return validate_and_enhance_with_cdc(invoice)
                         return None
                     xml_ai_slot_reserved = True
@@ -376,9 +376,10 @@ class OpenAIProcessor:
 
 # --------------------------------------------------------------- Helpers -----
 
-def _coerce_invoice_model(data: Dict[str, Any], email_metadata: Optional[Dict[str, Any]]):
+def _coerce_invoice_model(data: Dict[str, Any], email_metadata: Optional[Dict[str, Any]], trusted: bool = False):
     """
     Intenta construir app.models.models.InvoiceData; si falla, devuelve dict con metadatos.
+    `trusted=True` solo para la salida del parser XML nativo (ya tipada): evita revalidar.
     """
     # Verificar que data sea un diccionario
     if not isinstance(data, dict):
@@ -387,7 +388,10 @@ def _coerce_invoice_model(data: Dict[str, Any], email_metadata: Optional[Dict[st
         
     try:
         from app.models.models import InvoiceData  # lazy import evita ciclos
-        inv = InvoiceData.from_dict(data, email_metadata)
+        if trusted:
+            inv = InvoiceData.from_dict_trusted(data, email_metadata)
+        else:
+            inv = InvoiceData.from_dict(data, email_metadata)
         logger.debug(f"✅ InvoiceData creado exitosamente: {inv.numero_factura}")
         return inv
     except Exception as e:
@@ -1,5 +1,5 @@
 from __future__ import annotations
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, Iterable
 from datetime import datetime, timedelta
 from pymongo import MongoClient, ReturnDocument
 from pymongo.collection import Collection
@@ -129,7 +129,23 @@ class UserRepository:
 
     def get_trial_info(self, email: str) -> Dict[str, Any]:
         """Obtiene información del período de prueba del usuario"""
-        user = self.get_by_email(email)
+        return self._trial_info_from_user(self.get_by_email(email))
+
+    def get_trial_info_bulk(self, emails: Iterable[str]) -> Dict[str, Dict[str, Any]]:
+        """
+        Información de prueba de varios usuarios con una sola consulta ($in).
+        Devuelve {email_en_minúsculas: info}; los emails sin usuario se tratan como en get_trial_info.
+        """
+        wanted = {e.lower() for e in emails if e}
+        if not wanted:
+            return {}
+        projection = {'email': 1, 'is_trial_user': 1, 'trial_expires_at': 1,
+                      'ai_invoices_processed': 1, 'ai_invoices_limit': 1}
+        users = {u.get('email'): u for u in self._coll().find({'email': {'$in': list(wanted)}}, projection)}
+        return {email: self._trial_info_from_user(users.get(email)) for email in wanted}
+
+    @staticmethod
+    def _trial_info_from_user(user: Optional[Dict[str, Any]]) -> Dict[str, Any]:
         if not user:
             return {
                 'is_trial_user': True,
@@ -1,9 +1,42 @@
+import time
 from datetime import datetime
+from typing import Callable
+
+# Resolución de los relojes "gruesos": suficiente para timestamps de auditoría
+# (procesado_en, processed_at) y evita leer el reloj por cada modelo en lotes.
+_COARSE_CLOCK_TTL = 1.0
+
+
+def _coarse_clock(source: Callable[[], datetime]) -> Callable[[], datetime]:
+    cache = (float("-inf"), datetime.min)
+
+    def now() -> datetime:
+        nonlocal cache
+        mono = time.monotonic()
+        cached_at, value = cache
+        if mono - cached_at > _COARSE_CLOCK_TTL:
+            value = source()
+            cache = (mono, value)
+        return value
+
+    return now
+
+
+coarse_now = _coarse_clock(datetime.now)
+coarse_utcnow = _coarse_clock(datetime.utcnow)
+
 
 def try_parse_date(value):
     if not value:
         return None
 
+    # Camino rápido: fecha ISO "YYYY-MM-DD" (lo que entrega el parser XML SIFEN)
+    if type(value) is str and len(value) == 10 and value[4] == "-" and value[7] == "-":
+        try:
+            return datetime.fromisoformat(value)
+        except ValueError:
+            pass
+
     for fmt in ("%Y-%m-%d", "%d/%m/%Y", "%Y/%m/%d"):
         try:
             return datetime.strptime(value, fmt)
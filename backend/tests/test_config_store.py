@@ -0,0 +1,397 @@
+from __future__ import annotations
+
+import time
+from datetime import datetime, timedelta
+from typing import Any, Dict, List
+
+import pytest
+
+from app.modules.email_processor import config_store
+from app.modules.oauth import google_oauth
+
+
+class _FakeCursor(list):
+    def batch_size(self, size: int) -> "_FakeCursor":
+        return self
+
+
+class _FakeCollection:
+    def __init__(self) -> None:
+        self.docs: Dict[str, Dict[str, Any]] = {}
+        self.index_calls = 0
+        self.bulk_calls: List[int] = []
+        self.projections: List[Any] = []
+        self.count_calls: List[Dict[str, Any]] = []
+        self.find_one_hints: List[Any] = []
+
+    def create_index(self, *args: Any, **kwargs: Any) -> None:
+        self.index_calls += 1
+
+    def with_options(self, **kwargs: Any) -> "_FakeCollection":
+        self.read_preference = kwargs.get("read_preference")
+        return self
+
+    def create_indexes(self, models: List[Any]) -> None:
+        self.index_calls += 1
+
+    def insert_one(self, doc: Dict[str, Any]) -> None:
+        self.docs[doc["_id"]] = dict(doc)
+
+    def _matches(self, doc: Dict[str, Any], query: Dict[str, Any]) -> bool:
+        return all(doc.get(k) == v for k, v in query.items())
+
+    def find(self, query: Dict[str, Any], projection: Any = None, **kwargs: Any) -> _FakeCursor:
+        self.projections.append(projection)
+        found = [dict(d) for d in self.docs.values() if self._matches(d, query)]
+        if projection:
+            found = [{k: v for k, v in d.items() if k == "_id" or k in projection} for d in found]
+        return _FakeCursor(found)
+
+    def count_documents(self, query: Dict[str, Any], limit: int = 0, hint: Any = None) -> int:
+        self.count_calls.append({"limit": limit, "hint": hint})
+        total = len(self.find(query))
+        return min(total, limit) if limit else total
+
+    def distinct(self, key: str, query: Dict[str, Any]) -> List[Any]:
+        return sorted({d.get(key) for d in self.find(query) if d.get(key)})
+
+    def find_one(self, query: Dict[str, Any], projection: Any = None, **kwargs: Any) -> Dict[str, Any] | None:
+        self.find_one_hints.append(kwargs.get("hint"))
+        found = self.find(query)
+        return found[0] if found else None
+
+    def update_one(self, query: Dict[str, Any], update: Dict[str, Any]) -> Any:
+        doc = self.find_one(query)
+        if doc:
+            self.docs[doc["_id"]].update(update["$set"])
+        return type("UpdateResult", (), {"matched_count": int(bool(doc))})()
+
+    def find_one_and_update(self, query: Dict[str, Any], update: Any, projection: Any = None,
+                            return_document: Any = None) -> Dict[str, Any] | None:
+        doc = self.find_one(query)
+        if not doc:
+            return None
+        # Solo el pipeline que usa toggle_enabled: {"$not": [{"$ifNull": ["$campo", default]}]}
+        for stage in update:
+            for field, expr in stage["$set"].items():
+                ref, default = expr["$not"][0]["$ifNull"]
+                current = doc.get(ref.lstrip("$"))
+                doc[field] = not (default if current is None else current)
+        self.docs[doc["_id"]].update(doc)
+        return doc
+
+    def bulk_write(self, ops: List[Any], ordered: bool = True) -> None:
+        self.bulk_calls.append(len(ops))
+        for op in ops:
+            self.update_one(op._filter, op._doc)
+
+
+class _FakeMongoClient:
+    instances: List["_FakeMongoClient"] = []
+
+    def __init__(self, *args: Any, **kwargs: Any) -> None:
+        self.collection = _FakeCollection()
+        _FakeMongoClient.instances.append(self)
+
+    def __getitem__(self, name: str) -> Any:
+        return {config_store.COLLECTION_NAME: self.collection}
+
+
+class _FakeOAuthManager:
+    def __init__(self) -> None:
+        self.refreshed: List[str] = []
+
+    def is_token_expired(self, token_expiry: Any) -> bool:
+        return token_expiry is None
+
+    def refresh_access_token_sync(self, refresh_token: str) -> Dict[str, Any]:
+        self.refreshed.append(refresh_token)
+        return {"access_token": f"new-{refresh_token}", "expires_in": 3600}
+
+    def calculate_token_expiry(self, expires_in: int) -> datetime:
+        return datetime(2030, 1, 1)
+
+
+def _oauth_doc(config_id: str, token_expiry: str = "") -> Dict[str, Any]:
+    return {
+        "_id": config_id,
+        "owner_email": "owner@test.py",
+        "username": f"{config_id}@gmail.com",
+        "enabled": True,
+        "auth_type": "oauth2",
+        "refresh_token": f"rt-{config_id}",
+        "access_token": "old",
+        "token_expiry": token_expiry,
+    }
+
+
+@pytest.fixture
+def fake_oauth(monkeypatch):
+    manager = _FakeOAuthManager()
+    monkeypatch.setattr(google_oauth, "get_google_oauth_manager", lambda: manager)
+    return manager
+
+
+@pytest.fixture
+def fake_mongo(monkeypatch):
+    _FakeMongoClient.instances = []
+    monkeypatch.setattr(config_store, "MongoClient", _FakeMongoClient)
+    monkeypatch.setattr(config_store, "_CLIENT", None)
+    monkeypatch.setattr(config_store, "_CLIENT_PID", None)
+    monkeypatch.setattr(config_store, "_INDEXES_READY", False)
+    monkeypatch.setattr(config_store, "_COLLECTION", None)
+    monkeypatch.setattr(config_store, "_OWNER_INDEX_READY", False)
+    monkeypatch.setattr(config_store, "_OWNER_USERNAME_INDEX_READY", False)
+    monkeypatch.setattr(config_store, "_ENABLED_CACHE", {})
+    monkeypatch.setattr(config_store, "_PRIMARY_READS_UNTIL", 0.0)
+    monkeypatch.setattr(config_store, "_BG_REFRESH_EXECUTOR", None)
+    yield _FakeMongoClient
+    if config_store._BG_REFRESH_EXECUTOR is not None:
+        config_store._BG_REFRESH_EXECUTOR.shutdown(wait=True)
+
+
+def test_collection_reuses_client_and_creates_indexes_once(fake_mongo):
+    first = config_store._get_collection()
+    second = config_store._get_collection()
+
+    assert first is second
+    assert len(fake_mongo.instances) == 1
+    # Un createIndexes en lote + el índice único owner_email+username
+    assert first.index_calls == 2
+
+
+def test_client_is_recreated_after_fork(fake_mongo, monkeypatch):
+    config_store._get_client()
+    monkeypatch.setattr(config_store.os, "getpid", lambda: -1)
+    config_store._get_client()
+
+    assert len(fake_mongo.instances) == 2
+
+
+def test_toggle_enabled_negates_in_one_call(fake_mongo):
+    coll = config_store._get_collection()
+    coll.insert_one({"_id": "a", "owner_email": "owner@test.py", "enabled": True})
+    coll.insert_one({"_id": "legacy", "owner_email": "owner@test.py"})
+
+    assert config_store.toggle_enabled("a", owner_email="OWNER@test.py") is False
+    assert config_store.toggle_enabled("a", owner_email="owner@test.py") is True
+    # Documentos sin campo `enabled` se consideran habilitados
+    assert config_store.toggle_enabled("legacy") is False
+    assert config_store.toggle_enabled("missing") is None
+
+
+def test_expired_oauth_tokens_are_persisted_in_one_bulk_write(fake_mongo, fake_oauth):
+    coll = config_store._get_collection()
+    coll.insert_one(_oauth_doc("a"))
+    coll.insert_one(_oauth_doc("b"))
+    coll.insert_one(_oauth_doc("fresh", token_expiry="2030-01-01T00:00:00"))
+
+    configs = config_store.get_enabled_configs(owner_email="owner@test.py")
+
+    tokens = {c["id"]: c["access_token"] for c in configs}
+    assert tokens == {"a": "new-rt-a", "b": "new-rt-b", "fresh": "old"}
+    assert coll.bulk_calls == [2]
+    assert config_store._decrypt_secret(coll.docs["a"]["access_token"]) == "new-rt-a"
+
+
+def test_failed_refresh_keeps_expired_token(fake_mongo, fake_oauth, monkeypatch):
+    coll = config_store._get_collection()
+    coll.insert_one(_oauth_doc("ok"))
+    coll.insert_one(_oauth_doc("broken"))
+    original = fake_oauth.refresh_access_token_sync
+
+    def _refresh(refresh_token: str) -> Dict[str, Any]:
+        if refresh_token == "rt-broken":
+            raise RuntimeError("invalid_grant")
+        return original(refresh_token)
+
+    monkeypatch.setattr(fake_oauth, "refresh_access_token_sync", _refresh)
+
+    configs = config_store.get_enabled_configs(owner_email="owner@test.py")
+
+    tokens = {c["id"]: c["access_token"] for c in configs}
+    assert tokens == {"ok": "new-rt-ok", "broken": "old"}
+    assert coll.bulk_calls == [1]
+
+
+def test_list_configs_does_not_fetch_secrets_unless_requested(fake_mongo):
+    coll = config_store._get_collection()
+    coll.insert_one({**_oauth_doc("a"), "password": "secret", "internal_notes": "x" * 1000})
+
+    item = config_store.list_configs(owner_email="owner@test.py")[0]
+    assert "password" not in coll.projections[-1]
+    assert "refresh_token" not in coll.projections[-1]
+    assert item["refresh_token"] == ""
+
+    item = config_store.list_configs(include_password=True)[0]
+    assert item["password"] == "secret"
+    assert item["refresh_token"] == "rt-a"
+
+
+def test_enabled_configs_are_cached_until_a_mutation(fake_mongo):
+    coll = config_store._get_collection()
+    coll.insert_one({"_id": "a", "owner_email": "owner@test.py", "enabled": True})
+
+    first = config_store.get_enabled_configs(owner_email="owner@test.py", refresh_oauth_tokens=False)
+    first[0]["name"] = "mutated by caller"
+    second = config_store.get_enabled_configs(owner_email="OWNER@test.py", refresh_oauth_tokens=False)
+
+    assert len(coll.projections) == 1
+    assert second[0]["name"] == ""
+    assert coll.read_preference == config_store.ReadPreference.SECONDARY_PREFERRED
+
+    config_store.toggle_enabled("a")
+    coll.read_preference = None
+    assert config_store.get_enabled_configs(owner_email="owner@test.py", refresh_oauth_tokens=False) == []
+    # La primera lectura tras la escritura va al primario, no a un secundario atrasado
+    assert coll.read_preference is None
+
+
+def test_enabled_configs_cache_is_capped_by_token_expiry(fake_mongo, fake_oauth):
+    coll = config_store._get_collection()
+    expiry = (datetime.utcnow() + timedelta(seconds=5)).isoformat()
+    coll.insert_one(_oauth_doc("a", token_expiry=expiry))
+
+    config_store.get_enabled_configs(owner_email="owner@test.py")
+
+    (deadline, _), = config_store._ENABLED_CACHE.values()
+    assert deadline - time.monotonic() <= 5
+
+
+def test_expired_enabled_cache_entries_are_evicted(fake_mongo):
+    coll = config_store._get_collection()
+    coll.insert_one({"_id": "a", "owner_email": "owner@test.py", "enabled": True})
+    config_store.get_enabled_configs(owner_email="owner@test.py", refresh_oauth_tokens=False)
+    stale_key = next(iter(config_store._ENABLED_CACHE))
+    config_store._ENABLED_CACHE[stale_key] = (0.0, config_store._ENABLED_CACHE[stale_key][1])
+
+    config_store.get_enabled_configs(owner_email="other@test.py", refresh_oauth_tokens=False)
+
+    assert stale_key not in config_store._ENABLED_CACHE
+    assert len(config_store._ENABLED_CACHE) == 1
+
+
+def test_count_configs_by_owner_stops_at_cap(fake_mongo):
+    coll = config_store._get_collection()
+    for i in range(5):
+        coll.insert_one({"_id": str(i), "owner_email": "owner@test.py"})
+
+    assert config_store.count_configs_by_owner("OWNER@test.py") == 5
+    assert config_store.count_configs_by_owner("owner@test.py", cap=2) == 2
+    assert coll.count_calls[-1] == {"limit": 2, "hint": [("owner_email", 1), ("enabled", 1)]}
+
+
+def test_count_configs_by_owner_counts_empty_owner(fake_mongo):
+    config_store.create_config({"username": "a@test.py", "host": "imap.test.py", "port": 993}, owner_email="")
+    config_store.create_config({"username": "b@test.py", "host": "imap.test.py", "port": 993}, owner_email=None)
+
+    assert config_store.count_configs_by_owner("") == 2
+    assert config_store.count_configs_by_owner(None, cap=1) == 1
+
+
+def test_count_configs_by_owner_skips_hint_without_index(fake_mongo, monkeypatch):
+    def _fail(self, models):
+        raise RuntimeError("createIndexes not permitted")
+
+    monkeypatch.setattr(_FakeCollection, "create_indexes", _fail)
+    coll = config_store._get_collection()
+    coll.insert_one({"_id": "1", "owner_email": "owner@test.py"})
+
+    assert config_store.count_configs_by_owner("owner@test.py", cap=3) == 1
+    assert coll.count_calls[-1] == {"limit": 3, "hint": None}
+
+
+def test_single_lookups_share_the_listing_shape(fake_mongo):
+    coll = config_store._get_collection()
+    coll.insert_one({**_oauth_doc("a"), "password": "secret", "port": None})
+
+    listed = config_store.list_configs(include_password=True)[0]
+    assert config_store.get_by_id("a") == listed
+    assert config_store.get_by_username("a@gmail.com", owner_email="OWNER@test.py") == listed
+    assert coll.find_one_hints[-1] == [("owner_email", 1), ("username", 1)]
+    assert listed["port"] == 993
+
+    private = config_store.get_by_id("a", include_password=False)
+    assert private["password"] is None
+    assert private["access_token"] == ""
+
+
+class _FakeUserRepository:
+    def __init__(self) -> None:
+        self.bulk_calls: List[List[str]] = []
+
+    def get_trial_info_bulk(self, emails: Any) -> Dict[str, Dict[str, Any]]:
+        emails = sorted(emails)
+        self.bulk_calls.append(emails)
+        return {e: {"is_trial_user": True, "trial_expired": e.startswith("expired")} for e in emails}
+
+    def get_trial_info(self, email: str) -> Dict[str, Any]:
+        raise AssertionError("se esperaba una sola consulta en lote")
+
+
+def test_trial_check_fetches_owners_in_one_batch(fake_mongo, monkeypatch):
+    repo = _FakeUserRepository()
+    monkeypatch.setattr(config_store, "_get_user_repo", lambda: repo)
+    coll = config_store._get_collection()
+    for i, owner in enumerate(["active@test.py", "active@test.py", "expired@test.py"]):
+        coll.insert_one({"_id": str(i), "owner_email": owner, "enabled": True})
+
+    configs = config_store.get_enabled_configs(check_trial=True, refresh_oauth_tokens=False)
+
+    assert sorted(c["id"] for c in configs) == ["0", "1"]
+    assert repo.bulk_calls == [["active@test.py", "expired@test.py"]]
+
+
+@pytest.mark.parametrize("raw, expected", [
+    ("2030-01-01T00:00:00", datetime(2030, 1, 1)),
+    ("2030-01-01T00:00:00Z", datetime(2030, 1, 1)),
+    ("2030-01-01T03:00:00+03:00", datetime(2030, 1, 1)),
+    (datetime(2030, 1, 1), datetime(2030, 1, 1)),
+    ("", None),
+    ("not-a-date", None),
+])
+def test_parse_token_expiry_returns_naive_utc(raw, expected):
+    assert config_store._parse_token_expiry(raw) == expected
+
+
+def test_token_expiry_is_stored_in_canonical_form(fake_mongo):
+    coll = config_store._get_collection()
+    config_store.create_config({"id": "a", "token_expiry": "2030-01-01T03:00:00+03:00"}, owner_email="owner@test.py")
+    assert coll.docs["a"]["token_expiry"] == "2030-01-01T00:00:00"
+
+    config_store.update_config("a", {"token_expiry": datetime(2031, 1, 1)})
+    assert coll.docs["a"]["token_expiry"] == "2031-01-01T00:00:00"
+
+
+def test_tokens_close_to_expiry_are_refreshed_in_background(fake_mongo, fake_oauth):
+    coll = config_store._get_collection()
+    expiry = (datetime.utcnow() + timedelta(seconds=60)).isoformat()
+    coll.insert_one(_oauth_doc("a", token_expiry=expiry))
+
+    configs = config_store.get_enabled_configs(owner_email="owner@test.py")
+    # El token aún válido se devuelve sin esperar al refresh
+    assert configs[0]["access_token"] == "old"
+
+    config_store._BG_REFRESH_EXECUTOR.shutdown(wait=True)
+    assert fake_oauth.refreshed == ["rt-a"]
+    assert config_store._decrypt_secret(coll.docs["a"]["access_token"]) == "new-rt-a"
+    assert not config_store._BG_REFRESH_INFLIGHT
+
+
+def test_decryption_is_memoized_per_ciphertext(monkeypatch):
+    config_store._decrypt_token.cache_clear()
+    encrypted = config_store._encrypt_secret("secret")
+    calls = []
+    fernet = config_store._get_fernet()
+
+    class _CountingFernet:
+        def decrypt(self, token: bytes) -> bytes:
+            calls.append(token)
+            return fernet.decrypt(token)
+
+    monkeypatch.setattr(config_store, "_get_fernet", lambda: _CountingFernet())
+
+    assert config_store._decrypt_secret(encrypted) == "secret"
+    assert config_store._decrypt_secret(encrypted) == "secret"
+    assert len(calls) == 1
+    assert config_store._decrypt_secret(config_store.ENCRYPTION_PREFIX + "garbage") == ""
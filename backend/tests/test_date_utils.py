@@ -0,0 +1,17 @@
+from datetime import datetime
+
+from app.utils.date_utils import try_parse_date
+
+
+def test_try_parse_date_supported_formats():
+    assert try_parse_date("2020-05-07") == datetime(2020, 5, 7)
+    assert try_parse_date("07/05/2020") == datetime(2020, 5, 7)
+    assert try_parse_date("2020/05/07") == datetime(2020, 5, 7)
+
+
+def test_try_parse_date_rejects_invalid_values():
+    assert try_parse_date(None) is None
+    assert try_parse_date("") is None
+    assert try_parse_date("2020-13-01") is None
+    assert try_parse_date("2020- 5-07") is None
+    assert try_parse_date("2020-05-07T10:00:00") is None
@@ -0,0 +1,302 @@
+from __future__ import annotations
+
+import threading
+from typing import Any, List
+
+import pytest
+
+from app.models.models import EmailConfig
+from app.modules.email_processor import connection_pool
+
+
+class _FakeIMAP:
+    instances: List["_FakeIMAP"] = []
+
+    def __init__(self, host: str, port: int, timeout: Any = None) -> None:
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self.sock = None
+        self.alive = True
+        self.noops = 0
+        self.logged_out = False
+        self.shut_down = False
+        _FakeIMAP.instances.append(self)
+
+    def login(self, username: str, password: str) -> None:
+        pass
+
+    def noop(self) -> None:
+        self.noops += 1
+        if not self.alive:
+            raise connection_pool.imaplib.IMAP4.abort("socket error: EOF")
+
+    def close(self) -> None:
+        pass
+
+    def logout(self) -> None:
+        self.logged_out = True
+
+    def shutdown(self) -> None:
+        self.shut_down = True
+
+
+@pytest.fixture
+def fake_imap(monkeypatch):
+    _FakeIMAP.instances = []
+    monkeypatch.setattr(connection_pool.imaplib, "IMAP4_SSL", _FakeIMAP)
+    return _FakeIMAP
+
+
+@pytest.fixture
+def pool():
+    return connection_pool.IMAPConnectionPool(max_connections=2, connection_timeout=300)
+
+
+def _config(username: str = "a@test.py") -> EmailConfig:
+    return EmailConfig(host="imap.test.py", port=993, username=username, password="x")
+
+
+def test_connection_is_reused_after_return(fake_imap, pool):
+    conn = pool.get_connection(_config())
+    assert pool.return_connection(conn) is True
+
+    assert pool.get_connection(_config()) is conn
+    assert len(fake_imap.instances) == 1
+
+
+def test_accounts_do_not_block_each_other(fake_imap, pool):
+    pool.get_connection(_config("a@test.py"))
+    holder = pool._get_holder(pool._get_config_key(_config("a@test.py")))
+    result: List[Any] = []
+
+    with holder.lock:
+        worker = threading.Thread(target=lambda: result.append(pool.get_connection(_config("b@test.py"))))
+        worker.start()
+        worker.join(timeout=2)
+
+    assert not worker.is_alive()
+    assert result and result[0] is not None
+
+
+def test_dead_pooled_connection_is_closed_and_replaced(fake_imap, pool):
+    conn = pool.get_connection(_config())
+    pool.return_connection(conn)
+    conn.connection.alive = False
+    conn.last_used -= connection_pool._FRESH_WINDOW_SECONDS + 1
+
+    fresh = pool.get_connection(_config())
+
+    assert fresh is not conn
+    assert conn.connection.shut_down and not conn.connection.logged_out
+    assert pool.get_pool_stats()[conn.config_key]["active_connections"] == 1
+
+
+def test_returned_connection_is_handed_to_a_waiting_thread(fake_imap, pool):
+    first = pool.get_connection(_config())
+    pool.get_connection(_config())
+    result: List[Any] = []
+    waiter = threading.Thread(target=lambda: result.append(pool.get_connection(_config())))
+    waiter.start()
+
+    holder = pool._get_holder(first.config_key)
+    for _ in range(200):
+        if holder.waiters:
+            break
+        threading.Event().wait(0.01)
+    pool.return_connection(first)
+    waiter.join(timeout=2)
+
+    assert result == [first]
+    assert len(fake_imap.instances) == 2
+    assert not holder.idle
+
+
+def test_exhausted_pool_gives_up_after_wait_timeout(fake_imap):
+    pool = connection_pool.IMAPConnectionPool(max_connections=1, wait_timeout=0.05)
+    pool.get_connection(_config())
+
+    assert pool.get_connection(_config()) is None
+    assert pool.get_last_error(_config()).startswith("IMAP_POOL_EXHAUSTED")
+
+
+def test_recently_returned_connection_skips_noop(fake_imap, pool):
+    conn = pool.get_connection(_config())
+    pool.return_connection(conn)
+
+    assert pool.get_connection(_config()) is conn
+    assert conn.connection.noops == 0
+
+
+def test_discarded_connection_frees_its_slot(fake_imap):
+    pool = connection_pool.IMAPConnectionPool(max_connections=1, wait_timeout=0.05)
+    conn = pool.get_connection(_config())
+    pool.discard_connection(conn)
+
+    fresh = pool.get_connection(_config())
+    assert fresh is not None and fresh is not conn
+    assert conn.connection.shut_down
+
+
+def test_same_account_connections_are_created_concurrently(fake_imap, pool, monkeypatch):
+    barrier = threading.Barrier(2, timeout=2)
+    monkeypatch.setattr(_FakeIMAP, "login", lambda self, username, password: barrier.wait())
+    result: List[Any] = []
+    workers = [threading.Thread(target=lambda: result.append(pool.get_connection(_config()))) for _ in range(2)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join(timeout=3)
+
+    assert len(result) == 2 and all(result)
+    stats = pool.get_pool_stats()[result[0].config_key]
+    assert stats["active_connections"] == 2
+    assert stats["pending_connections"] == 0
+
+
+def test_backoff_delay_uses_full_jitter_with_cap(monkeypatch):
+    monkeypatch.setattr(connection_pool.random, "uniform", lambda low, high: (low, high))
+
+    assert connection_pool._backoff_delay(0, 1.0) == (0, 1.0)
+    assert connection_pool._backoff_delay(3, 1.0) == (0, 8.0)
+    assert connection_pool._backoff_delay(10, 1.0) == (0, 30.0)
+    assert connection_pool._backoff_delay(1, 0.25) == (0, 0.5)
+
+
+def test_failed_account_is_not_retried_before_next_retry_at(fake_imap, pool, monkeypatch):
+    def _refuse(self, username, password):
+        raise OSError("connection refused")
+
+    monkeypatch.setattr(_FakeIMAP, "login", _refuse)
+    monkeypatch.setattr(connection_pool, "_backoff_delay", lambda attempt, base=None: 60.0)
+    monkeypatch.setattr(connection_pool.time, "sleep", lambda seconds: None)
+
+    assert pool.get_connection(_config()) is None
+    attempts = len(fake_imap.instances)
+    assert pool.get_connection(_config()) is None
+    assert len(fake_imap.instances) == attempts
+
+
+def test_idle_connection_is_closed_at_its_expiry(fake_imap):
+    pool = connection_pool.IMAPConnectionPool(max_connections=1, connection_timeout=0.05)
+    conn = pool.get_connection(_config())
+    pool.return_connection(conn)
+
+    for _ in range(200):
+        if conn.connection.shut_down:
+            break
+        threading.Event().wait(0.01)
+
+    assert conn.connection.shut_down
+    assert pool.get_pool_stats()[conn.config_key]["pooled_connections"] == 0
+
+
+def test_most_recently_returned_connection_is_reused_first(fake_imap, pool):
+    first = pool.get_connection(_config())
+    second = pool.get_connection(_config())
+    pool.return_connection(first)
+    pool.return_connection(second)
+
+    assert pool.get_connection(_config()) is second
+
+
+def test_cleanup_probes_only_stale_connections(fake_imap):
+    pool = connection_pool.IMAPConnectionPool(max_connections=3, connection_timeout=100)
+    expired, stale, fresh = (pool.get_connection(_config()) for _ in range(3))
+    for conn in (expired, stale, fresh):
+        pool.return_connection(conn)
+    expired.last_used -= 120
+    stale.last_used -= 60
+
+    pool._sweep_expired_connections()
+
+    assert expired.connection.shut_down and expired.connection.noops == 0
+    assert stale.connection.noops == 1 and not stale.connection.shut_down
+    assert fresh.connection.noops == 0
+    assert list(pool._get_holder(fresh.config_key).idle) == [stale, fresh]
+
+
+def test_imap_timeouts_come_from_settings(fake_imap, pool, monkeypatch):
+    monkeypatch.setattr(connection_pool.settings, "IMAP_TIMEOUT_SECONDS", 12.0)
+
+    pool.get_connection(_config())
+
+    assert fake_imap.instances[-1].timeout == 12.0
+
+
+def test_close_all_connections_logs_out_gracefully(fake_imap, pool):
+    conn = pool.get_connection(_config())
+    pool.return_connection(conn)
+
+    pool.close_all_connections()
+
+    assert conn.connection.logged_out
+    assert not conn.is_alive
+
+
+def test_idle_checkout_does_not_take_the_account_lock(fake_imap, pool):
+    conn = pool.get_connection(_config())
+    pool.return_connection(conn)
+    holder = pool._get_holder(conn.config_key)
+    result: List[Any] = []
+
+    with holder.lock:
+        worker = threading.Thread(target=lambda: result.append(pool.get_connection(_config())))
+        worker.start()
+        worker.join(timeout=2)
+
+    assert not worker.is_alive()
+    assert result == [conn]
+
+
+def test_connection_returned_after_empty_checkout_is_not_left_idle(fake_imap, monkeypatch):
+    pool = connection_pool.IMAPConnectionPool(max_connections=1, wait_timeout=5)
+    conn = pool.get_connection(_config())
+    original = pool._checkout_idle
+    calls: List[int] = []
+
+    def _racing_checkout(holder, config):
+        if not calls:
+            calls.append(1)
+            # Otro hilo devuelve la conexión justo después del pop vacío
+            pool.return_connection(conn)
+            return None
+        return original(holder, config)
+
+    monkeypatch.setattr(pool, "_checkout_idle", _racing_checkout)
+    start = connection_pool.time.monotonic()
+
+    assert pool.get_connection(_config()) is conn
+    assert connection_pool.time.monotonic() - start < 1
+
+
+def test_cleanup_hands_probed_connection_to_waiting_thread(fake_imap):
+    pool = connection_pool.IMAPConnectionPool(max_connections=1, connection_timeout=100, wait_timeout=5)
+    conn = pool.get_connection(_config())
+    pool.return_connection(conn)
+    conn.last_used -= 60
+    holder = pool._get_holder(conn.config_key)
+    result: List[Any] = []
+    waiter = threading.Thread(target=lambda: result.append(pool.get_connection(_config())))
+
+    def _noop_while_thread_waits():
+        # Durante el NOOP la pila está vacía: el hilo queda esperando
+        waiter.start()
+        for _ in range(200):
+            if holder.waiters:
+                break
+            threading.Event().wait(0.01)
+
+    conn.connection.noop = _noop_while_thread_waits
+    pool._sweep_expired_connections()
+    waiter.join(timeout=1)
+
+    assert result == [conn]
+    assert not holder.idle
+
+
+def test_backoff_base_comes_from_settings(monkeypatch):
+    monkeypatch.setattr(connection_pool.settings, "IMAP_BACKOFF_BASE_SECONDS", 7.0)
+    monkeypatch.setattr(connection_pool.random, "uniform", lambda low, high: (low, high))
+
+    assert connection_pool._backoff_delay(0) == (0, 7.0)
@@ -0,0 +1,44 @@
+from datetime import datetime
+
+import pytest
+from pydantic import ValidationError
+
+from app.models.invoice_v2 import InvoiceHeader, Party, Totales, batch_timestamp
+
+
+def test_batch_timestamp_is_shared_by_headers():
+    fixed = datetime(2026, 1, 15, 12, 0, 0)
+    with batch_timestamp(fixed):
+        first = InvoiceHeader(id="a")
+        second = InvoiceHeader(id="b")
+
+    assert first.created_at == fixed
+    assert first.updated_at == fixed
+    assert second.created_at == fixed
+
+
+def test_headers_outside_batch_use_current_time():
+    with batch_timestamp(datetime(2000, 1, 1)):
+        pass
+    header = InvoiceHeader(id="c")
+    assert header.created_at.year > 2000
+
+
+def test_header_timestamps_share_one_clock_read():
+    header = InvoiceHeader(id="d")
+    assert header.created_at == header.updated_at
+
+    explicit = datetime(2025, 5, 5)
+    header = InvoiceHeader(id="e", created_at=explicit)
+    assert header.created_at == explicit
+    assert header.updated_at >= explicit
+
+
+def test_value_objects_are_frozen():
+    totales = Totales(total=100.0)
+    party = Party(ruc="80000000-1")
+
+    with pytest.raises(ValidationError):
+        totales.total = 1.0
+    with pytest.raises(ValidationError):
+        party.ruc = "x"
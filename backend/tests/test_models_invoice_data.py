@@ -0,0 +1,66 @@
+import pytest
+from pydantic import ValidationError
+
+from app.models.models import InvoiceData, safe_float
+
+
+@pytest.mark.parametrize(
+    "value, expected",
+    [
+        (None, 0.0),
+        (1500, 1500.0),
+        (2.5, 2.5),
+        ("1500", 1500.0),
+        (" 12 ", 12.0),
+        ("1,234.5", 1234.5),
+        ("1.234.567.89", 1234567.89),
+        ("1 000", 1000.0),
+        ("", 0.0),
+        ("abc", 0.0),
+        (["x", "3"], 3.0),
+    ],
+)
+def test_safe_float(value, expected):
+    assert safe_float(value) == expected
+
+
+def test_from_dict_fills_product_name_without_touching_input():
+    raw = [
+        {"nombre": "Item A", "cantidad": 1, "total": 100, "iva": 10},
+        {"descripcion": "Item B", "cantidad": 2, "total": 50, "iva": 5},
+        {"codigo": "C-1"},
+    ]
+    invoice = InvoiceData.from_dict({"numero_factura": "001-001-0000001", "productos": raw})
+
+    assert [p.nombre for p in invoice.productos] == ["Item A", "Item B", "C-1"]
+    assert "nombre" not in raw[1]
+
+
+@pytest.mark.parametrize(
+    "condicion, moneda, expected",
+    [
+        ("contado", "pyg", ("CO", "GS")),
+        ("Crédito", "usd", ("CR", "USD")),
+        ("CREDITO", "Dolar", ("CR", "USD")),
+        (None, "EUR", ("CO", "GS")),
+    ],
+)
+def test_from_dict_maps_condicion_and_moneda(condicion, moneda, expected):
+    invoice = InvoiceData.from_dict({"condicion_venta": condicion, "moneda": moneda})
+    assert (invoice.tipo_documento, invoice.moneda) == expected
+
+
+def test_procesado_en_uses_coarse_clock():
+    first = InvoiceData()
+    second = InvoiceData()
+    assert first.procesado_en == second.procesado_en
+
+
+def test_tipo_documento_only_accepts_co_cr():
+    with pytest.raises(ValidationError):
+        InvoiceData(tipo_documento="XX")
+
+
+def test_from_dict_normalizes_null_text_fields():
+    invoice = InvoiceData.from_dict({"ruc_emisor": None, "qr_url": None, "actividad_economica": None})
+    assert (invoice.ruc_emisor, invoice.qr_url, invoice.actividad_economica) == ("", "", "")
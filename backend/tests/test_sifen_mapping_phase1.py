@@ -81,6 +81,18 @@ def test_enterprise_xml_end_to_end_mapping_pipeline():
     assert doc.items[1].iva == 10
 
 
+def test_trusted_xml_construction_matches_validated_path():
+    success, normalized = parse_paraguayan_xml(_load_enterprise_sample_xml())
+    assert success is True
+    meta = {"sender": "proveedor@test.py", "message_id": "<abc@test>"}
+
+    validated = InvoiceData.from_dict(normalized, meta)
+    trusted = InvoiceData.from_dict_trusted(normalized, meta)
+
+    exclude = {"procesado_en"}
+    assert trusted.model_dump(exclude=exclude) == validated.model_dump(exclude=exclude)
+
+
 def test_map_invoice_uses_invoice_minio_key_when_param_missing():
     invoice = InvoiceData(
         fecha=datetime(2026, 2, 1),
@@ -111,6 +123,34 @@ def test_map_invoice_prefers_explicit_minio_key():
     assert doc.header.minio_key == "2026/owner@test.py/02/010101_new.pdf"
 
 
+def test_map_invoice_items_from_validated_and_raw_products():
+    invoice = InvoiceData(
+        numero_factura="001-001-0000003",
+        productos=[
+            {"nombre": "Item A", "cantidad": 2, "precio_unitario": 500, "total": 1000, "iva": 10},
+            {"nombre": None, "cantidad": None, "precio_unitario": 0, "total": 300, "iva": 5},
+        ],
+    )
+    doc = map_invoice(invoice)
+    assert [(it.linea, it.descripcion, it.cantidad, it.total, it.iva) for it in doc.items] == [
+        (1, "Item A", 2.0, 1000.0, 10),
+        (2, "", 0.0, 300.0, 5),
+    ]
+
+    # Productos como dicts crudos (sin validar) siguen soportados
+    invoice.productos = [{"articulo": "Item B", "cantidad": "3", "total": 90}]
+    doc = map_invoice(invoice)
+    assert (doc.items[0].descripcion, doc.items[0].cantidad, doc.items[0].total) == ("Item B", 3.0, 90.0)
+
+
+def test_map_invoice_normalizes_missing_text_to_empty_string():
+    # Documentos leídos sin validar (model_construct) pueden traer None en campos de texto
+    invoice = InvoiceData.model_construct(numero_factura="001-001-0000004", cdc=None, timbrado=None, email_cliente=None)
+    doc = map_invoice(invoice)
+    assert (doc.header.cdc, doc.header.timbrado, doc.header.receptor.email) == ("", "", "")
+    assert doc.header.processing_error is None
+
+
 def test_sifen_matrix_alignment_with_models_and_export_fields():
     invoice_fields = set(InvoiceData.model_fields.keys())
     header_fields = set(InvoiceHeader.model_fields.keys())
@@ -0,0 +1,39 @@
+from app.models.export_template import ExportField, FieldTransform, FieldType
+from app.modules.excel_exporter.template_exporter import ExcelExporter
+
+
+def _field(transform_type: str, **params) -> ExportField:
+    return ExportField(
+        field_key="custom",
+        display_name="Custom",
+        field_type=FieldType.CURRENCY,
+        transform=FieldTransform(type=transform_type, params=params),
+    )
+
+
+def test_sum_fields_mixes_numeric_and_string_values():
+    exporter = ExcelExporter()
+    field = _field("sum_fields", fields=["gravado_5", "gravado_10", "monto_exento", "exonerado"])
+    invoice = {"gravado_5": 1000, "gravado_10": "2500.5", "monto_exento": None, "exonerado": 10.0}
+
+    assert exporter._apply_transform(field, None, invoice) == 3510.5
+
+
+def test_sum_fields_ignores_empty_and_invalid_values():
+    exporter = ExcelExporter()
+    field = _field("sum_fields", fields=["a", "b", "c", "missing"])
+    invoice = {"a": "", "b": "abc", "c": 7}
+
+    assert exporter._apply_transform(field, None, invoice) == 7.0
+
+
+def test_product_subfield_extraction_from_dict_products():
+    exporter = ExcelExporter()
+    field = ExportField(
+        field_key="productos.nombre",
+        display_name="Productos",
+        field_type=FieldType.TEXT,
+    )
+    invoice = {"productos": [{"nombre": "A"}, {"descripcion": "B"}, {"articulo": "C"}, {"nombre": None}]}
+
+    assert exporter._extract_field_value(invoice, field) == ["A", "B", "C"]